@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+
+# 全セッションで共有するイベントループ（バックグラウンドスレッドで実行）
+# ネットワーク待ちのステージをコルーチンとして実行し、待機中にスレッドを占有しない
+_loop = None
+_loop_lock = threading.Lock()
+
+# 実行中のコルーチン数（同時に処理中のステージ数）
+_in_flight = 0
+_max_in_flight = 0
+
+
+def get_loop():
+    """
+    共有のイベントループを取得（未起動の場合は起動）
+    Returns:
+        asyncio.AbstractEventLoop: イベントループ
+    """
+    global _loop
+    if _loop is not None:
+        return _loop
+
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async_engine", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def _track(coro):
+    global _in_flight, _max_in_flight
+    # カウンタはイベントループのスレッドでのみ更新
+    _in_flight += 1
+    _max_in_flight = max(_max_in_flight, _in_flight)
+    try:
+        return await coro
+    finally:
+        _in_flight -= 1
+
+
+def submit(coro):
+    """
+    コルーチンを共有のイベントループで実行
+    Args:
+        coro: 実行するコルーチン
+    Returns:
+        concurrent.futures.Future: 実行結果（cancel()でコルーチンも中止される）
+    """
+    return asyncio.run_coroutine_threadsafe(_track(coro), get_loop())
+
+
+def run(coro, timeout=None):
+    """
+    コルーチンを共有のイベントループで実行し、完了を待って結果を返す
+    """
+    return submit(coro).result(timeout)
+
+
+def get_stats():
+    """
+    イベントループの計測値を取得
+    Returns:
+        dict: 実行中・最大同時実行のコルーチン数
+    """
+    return {"in_flight": _in_flight, "max_in_flight": _max_in_flight}
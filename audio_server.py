@@ -0,0 +1,429 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pydub import AudioSegment
+import constants as ct
+
+
+# サーバーはプロセス内で1つだけ起動する（全セッション共有）
+_server = None
+_server_lock = threading.Lock()
+
+# (パス, 更新時刻, サイズ) → コンテンツハッシュ のメモ（最近使われた順、上限件数まで）
+_digest_cache = OrderedDict()
+_digest_lock = threading.Lock()
+
+# 配信ディレクトリの整理を複数のスレッドで同時に実行しない
+_static_lock = threading.Lock()
+
+# ストリーミング再生中の音声（ストリームID → AudioStream）
+_streams = {}
+_streams_lock = threading.Lock()
+
+# AUDIO_SERVER_PUBLIC_URLが未指定の場合に配信サーバーを利用するブラウザ側のホスト
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+_FILE_NAME_PATTERN = re.compile(r"^[0-9a-f]{16}(_x[0-9.]+)?\.wav$")
+_STREAM_NAME_PATTERN = re.compile(r"^([0-9a-f]{32})\.mp3$")
+
+
+class AudioStream:
+    """
+    受信中の音声データを保持し、配信側へ逐次受け渡すバッファ
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self.created_at = time.time()
+        self.closed_at = None
+        self.condition = threading.Condition()
+
+    def write(self, chunk):
+        with self.condition:
+            if self.closed:
+                return
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.closed_at = time.time()
+            self.condition.notify_all()
+
+    def iter_chunks(self):
+        """
+        書き込み済みのチャンクを順に返し、未着分は到着まで待機する
+        """
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.closed:
+                    self.condition.wait(timeout=ct.AUDIO_STREAM_WAIT_TIMEOUT)
+                    if index >= len(self.chunks) and not self.closed:
+                        # 送信側が止まった場合は配信を打ち切る
+                        return
+                if index >= len(self.chunks):
+                    return
+                chunk = self.chunks[index]
+            index += 1
+            yield chunk
+
+
+class AudioRequestHandler(BaseHTTPRequestHandler):
+    """
+    コンテンツハッシュ付きの音声ファイルを配信するハンドラ
+    - Rangeリクエスト（単一範囲）に対応
+    - ファイル名がハッシュで不変のため、長期キャッシュ（immutable）を指定
+    - 音声合成の受信中は stream/ 配下で受信済みのデータから逐次配信
+    """
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        file_name = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+        prefix = f"/{ct.AUDIO_SERVER_URL_PREFIX}/"
+        if self.path.startswith(f"{prefix}stream/"):
+            self._serve_stream(file_name, send_body)
+            return
+        if not self.path.startswith(prefix) or not _FILE_NAME_PATTERN.match(file_name):
+            self.send_error(404)
+            return
+
+        file_path = os.path.join(ct.AUDIO_STATIC_DIR, file_name)
+        if not os.path.exists(file_path):
+            self.send_error(404)
+            return
+
+        # ファイル名自体がハッシュなのでETagとして流用
+        etag = f'"{file_name}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self._send_cache_headers(etag)
+            self.end_headers()
+            return
+
+        file_size = os.path.getsize(file_path)
+        start, end = 0, file_size - 1
+        status = 200
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = _RANGE_PATTERN.match(range_header.strip())
+            if match is None or match.group(1) == match.group(2) == "":
+                self._send_range_not_satisfiable(file_size)
+                return
+            if match.group(1) == "":
+                # "bytes=-500" のような末尾指定
+                start = max(file_size - int(match.group(2)), 0)
+            else:
+                start = int(match.group(1))
+                if match.group(2) != "":
+                    end = min(int(match.group(2)), file_size - 1)
+            if start > end or start >= file_size:
+                self._send_range_not_satisfiable(file_size)
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+        self._send_cache_headers(etag)
+        self.end_headers()
+
+        if not send_body:
+            return
+
+        remaining = end - start + 1
+        with open(file_path, "rb") as audio_file:
+            audio_file.seek(start)
+            while remaining > 0:
+                chunk = audio_file.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    # ブラウザ側でシーク・停止された場合
+                    return
+                remaining -= len(chunk)
+
+    def _serve_stream(self, file_name, send_body):
+        match = _STREAM_NAME_PATTERN.match(file_name)
+        with _streams_lock:
+            audio_stream = _streams.get(match.group(1)) if match else None
+        if audio_stream is None:
+            self.send_error(404)
+            return
+
+        # 全体の長さが未確定のため、Content-Lengthを付けず接続終了で終端を示す
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        if not send_body:
+            return
+
+        for chunk in audio_stream.iter_chunks():
+            try:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def _send_cache_headers(self, etag):
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={ct.AUDIO_CACHE_MAX_AGE}, immutable")
+        # Streamlitとはポートが異なるため、クロスオリジンでの再生を許可
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+    def _send_range_not_satisfiable(self, file_size):
+        self.send_response(416)
+        self.send_header("Content-Range", f"bytes */{file_size}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # リクエスト毎のアクセスログは出力しない
+        pass
+
+
+def start_audio_server():
+    """
+    音声配信サーバーを（未起動の場合のみ）バックグラウンドスレッドで起動
+    Returns:
+        bool: サーバーが利用可能な場合True、起動に失敗した場合False
+    """
+    global _server
+
+    with _server_lock:
+        if _server is not None:
+            return True
+
+        try:
+            os.makedirs(ct.AUDIO_STATIC_DIR, exist_ok=True)
+            port = int(os.environ.get("AUDIO_SERVER_PORT", ct.AUDIO_SERVER_PORT))
+            # 公開URLが未指定の場合はlocalhostのURLしか配信しないため、外部からの接続は受け付けない
+            if os.environ.get("AUDIO_SERVER_PUBLIC_URL"):
+                host = ct.AUDIO_SERVER_PUBLIC_HOST
+            else:
+                host = ct.AUDIO_SERVER_HOST
+            _server = ThreadingHTTPServer((host, port), AudioRequestHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"[AUDIO SERVER] 起動完了: {host}:{port}")
+            return True
+        except OSError as e:
+            print(f"[ERROR] 音声配信サーバーの起動に失敗しました: {e}")
+            return False
+
+
+def is_reachable(request_host):
+    """
+    ブラウザから配信サーバーに接続できるかを判定
+    - AUDIO_SERVER_PUBLIC_URLが指定されている場合は接続可能とみなす
+    - 未指定の場合はブラウザがlocalhostでアプリを開いている場合のみ（http://localhost:<port> に接続するため）
+    Args:
+        request_host: ブラウザがアクセスしているホスト（Hostヘッダーの値）
+    Returns:
+        bool: 接続できる場合True
+    """
+    if os.environ.get("AUDIO_SERVER_PUBLIC_URL"):
+        return True
+    if not request_host:
+        return False
+
+    host_name = request_host.strip().lower()
+    if not host_name.endswith("]"):
+        host_name = host_name.rsplit(":", 1)[0]
+    return host_name in _LOCAL_HOSTS
+
+
+def get_public_url(file_name):
+    """
+    ブラウザから参照する音声ファイルのURLを取得
+    Args:
+        file_name: 配信ディレクトリ内のファイル名
+    Returns:
+        str: 音声ファイルのURL
+    """
+    base_url = os.environ.get("AUDIO_SERVER_PUBLIC_URL")
+    if not base_url:
+        port = int(os.environ.get("AUDIO_SERVER_PORT", ct.AUDIO_SERVER_PORT))
+        base_url = f"http://localhost:{port}"
+
+    return f"{base_url.rstrip('/')}/{ct.AUDIO_SERVER_URL_PREFIX}/{file_name}"
+
+
+def open_stream():
+    """
+    ストリーミング再生用のバッファを作成
+    Returns:
+        tuple: (音声ストリームのURL, AudioStream)
+    """
+    stream_id = uuid.uuid4().hex
+    audio_stream = AudioStream()
+
+    with _streams_lock:
+        _expire_streams()
+        _streams[stream_id] = audio_stream
+
+    return get_public_url(f"stream/{stream_id}.mp3"), audio_stream
+
+
+def _expire_streams():
+    """
+    受信完了から一定時間経過したストリーム・受信が完了しないまま残ったストリームを破棄（_streams_lockを取得して呼び出す）
+    - 未完了のストリームは閉じて、配信中のリクエストの待機を終了させる
+    """
+    now = time.time()
+    for stream_id, audio_stream in list(_streams.items()):
+        if audio_stream.closed:
+            expired = audio_stream.closed_at < now - ct.AUDIO_STREAM_RETENTION
+        else:
+            expired = audio_stream.created_at < now - ct.AUDIO_STREAM_MAX_AGE
+        if expired:
+            audio_stream.close()
+            del _streams[stream_id]
+
+
+def has_stream(stream_url):
+    """
+    ストリーミング再生のURLが配信中（または受信完了後の保持期間内）かを判定
+    Args:
+        stream_url: open_streamで取得したURL
+    Returns:
+        bool: 配信可能な場合True
+    """
+    match = _STREAM_NAME_PATTERN.match(stream_url.rsplit("/", 1)[-1])
+    if match is None:
+        return False
+
+    with _streams_lock:
+        _expire_streams()
+        return match.group(1) in _streams
+
+
+def _file_digest(file_path):
+    """
+    ファイル内容のハッシュ値（先頭16桁）を取得
+    Args:
+        file_path: 対象ファイルのパス
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+        if digest is not None:
+            _digest_cache.move_to_end(key)
+            return digest
+
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as target_file:
+        for chunk in iter(lambda: target_file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()[:16]
+
+    with _digest_lock:
+        _digest_cache[key] = digest
+        while len(_digest_cache) > ct.AUDIO_DIGEST_CACHE_MAX_ENTRIES:
+            _digest_cache.popitem(last=False)
+
+    return digest
+
+
+def _prune_static_dir(keep_file_name):
+    """
+    配信ディレクトリのファイルのうち、保持期間を過ぎたもの・上限件数を超えたものを削除
+    - 最後に使われた時刻（更新時刻）が古いものから削除
+    - 削除後に再読み上げされた場合はpublish_audioで再作成される
+    Args:
+        keep_file_name: 削除しないファイル名（登録したばかりのファイル）
+    """
+    entries = []
+    for file_name in os.listdir(ct.AUDIO_STATIC_DIR):
+        if file_name == keep_file_name or not _FILE_NAME_PATTERN.match(file_name):
+            continue
+        try:
+            entries.append((os.path.getmtime(os.path.join(ct.AUDIO_STATIC_DIR, file_name)), file_name))
+        except FileNotFoundError:
+            continue
+    entries.sort()
+
+    expired_before = time.time() - ct.AUDIO_STATIC_MAX_AGE_SEC
+    # 登録したばかりのファイルを含めて上限件数に収める
+    excess_count = len(entries) + 1 - ct.AUDIO_STATIC_MAX_FILES
+    for index, (modified_at, file_name) in enumerate(entries):
+        if index >= excess_count and modified_at >= expired_before:
+            break
+        try:
+            os.remove(os.path.join(ct.AUDIO_STATIC_DIR, file_name))
+        except FileNotFoundError:
+            pass
+
+
+def publish_audio(audio_file_path, speed=1.0):
+    """
+    音声ファイルを配信ディレクトリに登録し、URLを返す
+    - 同じ内容・同じ再生速度であれば同じURLとなるため、再読み上げはブラウザキャッシュから再生される
+    Args:
+        audio_file_path: 元の音声ファイル（wav）のパス
+        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
+    Returns:
+        str: 音声ファイルのURL
+    """
+    digest = _file_digest(audio_file_path)
+    if speed != 1.0:
+        file_name = f"{digest}_x{speed}.wav"
+    else:
+        file_name = f"{digest}.wav"
+
+    published_path = os.path.join(ct.AUDIO_STATIC_DIR, file_name)
+    try:
+        # 最後に使われた時刻として更新時刻を更新（配信ディレクトリの整理で残す）
+        os.utime(published_path)
+        return get_public_url(file_name)
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(ct.AUDIO_STATIC_DIR, exist_ok=True)
+    temp_path = f"{published_path}.{threading.get_ident()}.tmp"
+
+    audio = AudioSegment.from_wav(audio_file_path)
+    if speed != 1.0:
+        # frame_rateを変更することで速度を調整
+        modified_audio = audio._spawn(
+            audio.raw_data,
+            overrides={"frame_rate": int(audio.frame_rate * speed)}
+        )
+        # 元のframe_rateに戻すことで正常再生させる
+        audio = modified_audio.set_frame_rate(audio.frame_rate)
+    audio.export(temp_path, format="wav")
+
+    # 書き込み途中のファイルが配信されないよう、完成後にリネーム
+    os.replace(temp_path, published_path)
+
+    # 上限件数・保持期間を超えたファイルを削除
+    with _static_lock:
+        _prune_static_dir(file_name)
+
+    return get_public_url(file_name)
@@ -0,0 +1,196 @@
+"""
+録音済みの発話をStreamlitを使わずに一括処理するCLI
+
+  python batch_cli.py recordings/ batch_output/ --workers 8
+  python batch_cli.py recordings/ batch_output/ --workers 8 --base-url http://localhost:8765/v1
+  python batch_cli.py recordings/ batch_output/ --workers 64 --engine thread  # 従来のスレッド実行と比較
+
+各発話を 音声認識 → 英会話講師の応答生成 → 音声合成 → wav変換 の順に処理し、
+出力ディレクトリに応答音声（audio/<通し番号>_<ファイル名>.wav）と結果（results.jsonl）を書き出す。
+プロンプト変更（constants.py）の一括確認やスループット計測に使用する。
+オフラインで実行する場合は tools/fake_openai_server.py を起動し、--base-url で指定する。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+from langchain_openai import ChatOpenAI
+from langchain.memory import ConversationBufferMemory
+from pydub import AudioSegment
+import async_engine
+import functions as ft
+import constants as ct
+import pipeline
+import transcript_cache
+
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac"}
+ENGINE_ASYNC = "async"
+ENGINE_THREAD = "thread"
+
+
+def process_utterance(index, audio_file_path, output_dir, openai_obj, async_openai_obj, llm, system_template,
+                      stage_executor, engine):
+    """
+    1件の発話をターンのパイプラインで処理
+    - 発話ごとに新しい会話メモリを使用（発話同士は独立）
+    Args:
+        index: 入力ファイルの通し番号（拡張子だけが異なる同名の入力と出力ファイル名が重ならないよう付与）
+        audio_file_path: 録音ファイルのパス
+        output_dir: 出力ディレクトリ
+        openai_obj: OpenAIのオブジェクト（threadエンジンで使用）
+        async_openai_obj: AsyncOpenAIのオブジェクト（asyncエンジンで使用）
+        llm: 応答生成に使用するLLM
+        system_template: システムプロンプト
+        stage_executor: ステージを実行するワーカー
+        engine: async（ネットワーク待ちのステージを共有のイベントループで実行）/ thread（全ステージをワーカーで実行）
+    Returns:
+        dict: 処理結果（文字起こし・応答・音声ファイル・ステージ毎の所要時間）
+    """
+    result = {"file": str(audio_file_path), "transcript": None, "reply": None, "audio": None, "error": None}
+    turn = pipeline.TurnPipeline(executor=stage_executor)
+    started = time.monotonic()
+
+    try:
+        # transcribe_audioは入力ファイルを削除するため、wavに変換した作業用ファイルを渡す
+        output_name = f"{index:04d}_{audio_file_path.stem}.wav"
+        work_file_path = output_dir / "work" / output_name
+        AudioSegment.from_file(audio_file_path).export(work_file_path, format="wav")
+
+        # 発話は1件ずつ独立しているため履歴は常に空。トークン数の計算（tiktokenの辞書取得）が不要な
+        # バッファメモリを使い、オフラインでも実行できるようにする
+        chain = ft.create_chain(system_template, llm=llm, memory=ConversationBufferMemory(return_messages=True))
+
+        if engine == ENGINE_ASYNC:
+            transcript = turn.run_async_stage(
+                "transcribe",
+                lambda stage: ft.transcribe_audio_async(str(work_file_path), async_openai_obj, timeout=stage.timeout)
+            )
+            result["transcript"] = transcript.text
+            result["reply"] = turn.run_async_stage("chat", lambda stage: ft.generate_reply(chain, transcript.text))
+            speech = turn.run_async_stage(
+                "tts",
+                lambda stage: ft.synthesize_speech_async(async_openai_obj, result["reply"], timeout=stage.timeout)
+            )
+        else:
+            transcript = turn.run_stage(
+                "transcribe",
+                lambda stage: ft.transcribe_audio(str(work_file_path), openai_obj, timeout=stage.timeout)
+            )
+            result["transcript"] = transcript.text
+            result["reply"] = turn.run_stage("chat", lambda stage: chain.predict(input=transcript.text))
+            speech = turn.run_stage(
+                "tts",
+                lambda stage: ft.synthesize_speech(openai_obj, result["reply"], timeout=stage.timeout)
+            )
+        audio_output_file_path = output_dir / "audio" / output_name
+        turn.run_stage("transcode", lambda stage: ft.save_to_wav(speech, str(audio_output_file_path)))
+        result["audio"] = str(audio_output_file_path)
+
+        turn.complete()
+    except pipeline.StageTimeout as e:
+        result["error"] = f"timeout: {e}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["timings"] = dict(turn.timings, total=round(time.monotonic() - started, 3))
+    return result
+
+
+def print_summary(results, wall_time):
+    """
+    件数・スループット・ステージ毎の所要時間（中央値 / p95）を表示
+    """
+    succeeded = [r for r in results if r["error"] is None]
+    print(f"[BATCH] {len(results)}件（成功 {len(succeeded)} / 失敗 {len(results) - len(succeeded)}）, "
+          f"所要時間 {wall_time:.2f}秒, スループット {len(results) / wall_time:.2f}件/秒")
+
+    for stage in list(ct.STAGE_TIMEOUTS) + ["total"]:
+        values = sorted(r["timings"][stage] for r in succeeded if stage in r["timings"])
+        if values:
+            p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+            print(f"  {stage:<10} 中央値 {statistics.median(values):.3f}秒 / p95 {p95:.3f}秒")
+
+    metrics = pipeline.get_metrics()
+    failures = {name: value for name, value in metrics.items() if not name.startswith("duration.")}
+    if failures:
+        print(f"  計測値: {failures}")
+    print(f"  文字起こしキャッシュ: {transcript_cache.get_stats()}")
+    print(f"  イベントループ: {async_engine.get_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", type=Path, help="録音ファイルのディレクトリ")
+    parser.add_argument("output_dir", type=Path, help="結果の出力先ディレクトリ")
+    parser.add_argument("--workers", type=int, default=4, help="同時に処理する発話数（アプリの同時セッション数に相当）")
+    parser.add_argument("--engine", choices=[ENGINE_ASYNC, ENGINE_THREAD], default=ENGINE_ASYNC,
+                        help="async: ネットワーク待ちのステージをイベントループで実行 / thread: 全ステージをワーカーで実行")
+    parser.add_argument("--stage-workers", type=int, default=ct.PIPELINE_MAX_WORKERS,
+                        help="ステージを実行するワーカー数（アプリの共有ワーカー数に相当）")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="OpenAI APIの接続先（疑似サーバー等）")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--system-template", default="SYSTEM_TEMPLATE_BASIC_CONVERSATION",
+                        help="constants.pyのシステムプロンプト名")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # 疑似サーバーに接続する場合はAPIキーが未設定でも実行可能とする
+    api_key = os.environ.get("OPENAI_API_KEY") or ("fake" if args.base_url else None)
+
+    audio_files = sorted(p for p in args.input_dir.iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+    if not audio_files:
+        parser.error(f"録音ファイルが見つかりません: {args.input_dir}")
+
+    for sub_dir in ("audio", "work"):
+        (args.output_dir / sub_dir).mkdir(parents=True, exist_ok=True)
+    os.makedirs(ct.AUDIO_OUTPUT_DIR, exist_ok=True)
+
+    openai_obj = OpenAI(api_key=api_key, base_url=args.base_url)
+    async_openai_obj = AsyncOpenAI(api_key=api_key, base_url=args.base_url)
+    llm = ChatOpenAI(
+        model_name=args.model,
+        temperature=0.5,
+        api_key=api_key,
+        base_url=args.base_url,
+        timeout=ct.STAGE_TIMEOUTS["chat"],
+        # ワーカースレッドでの同期呼び出しは中止できないため再試行しない
+        # （イベントループで実行する場合はステージのタイムアウトで取り消されるため再試行する）
+        max_retries=0 if args.engine == ENGINE_THREAD else ct.OPENAI_MAX_RETRIES
+    )
+    system_template = getattr(ct, args.system_template)
+
+    print(f"[BATCH] {len(audio_files)}件を並列数{args.workers}（{args.engine}）で処理します")
+    started = time.monotonic()
+    results_path = args.output_dir / "results.jsonl"
+    with ThreadPoolExecutor(max_workers=args.workers) as item_executor, \
+            ThreadPoolExecutor(max_workers=args.stage_workers, thread_name_prefix="batch_stage") as stage_executor, \
+            open(results_path, "w", encoding="utf-8") as results_file:
+        futures = [
+            item_executor.submit(
+                process_utterance, index, path, args.output_dir, openai_obj, async_openai_obj, llm, system_template,
+                stage_executor, args.engine
+            )
+            for index, path in enumerate(audio_files)
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            status = "OK" if result["error"] is None else f"NG ({result['error']})"
+            print(f"[BATCH] {Path(result['file']).name}: {status} {result['timings']['total']:.2f}秒")
+
+    shutil.rmtree(args.output_dir / "work", ignore_errors=True)
+    print_summary(results, time.monotonic() - started)
+    print(f"[BATCH] 結果: {results_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+会話メモリ方式ごとのプロンプトサイズとレイテンシの比較ベンチマーク
+
+  python benchmarks/bench_memory.py --turns 100 --ms-per-1k-tokens 150
+
+OpenAIには接続せず、プロンプトのトークン数に比例して待機する疑似LLMで
+ConversationChainを実行する。要約メモリの要約生成呼び出しも同じ疑似LLMを通るため、
+そのコストも1ターンあたりのレイテンシに含まれる。
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+from pydantic import Field
+from langchain.chains import ConversationChain
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    MessagesPlaceholder,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import constants as ct
+from retrieval_memory import RetrievalBufferMemory
+from turn_history import TurnChatMessageHistory
+
+
+PLACES = ["museum", "office", "station", "beach", "library", "gym", "cafe", "airport", "park", "hospital"]
+PEOPLE = ["sister", "boss", "neighbor", "teacher", "friend", "coworker", "doctor", "cousin"]
+THINGS = ["movies", "travel plans", "a new project", "cooking", "the weather", "football", "music", "a job interview"]
+
+SUMMARY_WORDS = 250  # 疑似LLMが返す要約の語数（実運用の要約と同程度に頭打ちさせる）
+
+
+class FakeTutorModel(BaseChatModel):
+    """
+    プロンプトのトークン数に比例した時間だけ待機して固定応答を返す疑似チャットモデル
+    """
+
+    ms_per_1k_tokens: float = 150.0
+    calls: List[dict] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tutor"
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4 + 1
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt_tokens = self.get_num_tokens_from_messages(messages)
+        time.sleep(prompt_tokens / 1000 * self.ms_per_1k_tokens / 1000)
+
+        prompt_text = " ".join(str(message.content) for message in messages)
+        # 要約生成はSystemMessageを含まない単一のプロンプトとして呼び出される
+        is_summary = not isinstance(messages[0], SystemMessage)
+        self.calls.append({"summary": is_summary, "prompt_tokens": prompt_tokens})
+
+        if is_summary:
+            content = " ".join(prompt_text.split()[-SUMMARY_WORDS:])
+        else:
+            content = (
+                "That sounds great! By the way, you could say it a little more naturally like this. "
+                "What did you enjoy the most, and would you like to do it again next weekend?"
+            )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+def build_memory(backend, llm):
+    # アプリと同様に会話記録（Turn）のリストを履歴として参照させる
+    chat_memory = TurnChatMessageHistory([])
+    if backend == ct.MEMORY_BACKEND_RETRIEVAL:
+        return RetrievalBufferMemory(
+            llm=llm,
+            chat_memory=chat_memory,
+            recent_turns=ct.MEMORY_RECENT_TURNS,
+            token_budget=ct.MEMORY_TOKEN_BUDGET,
+            return_messages=True
+        )
+    return ConversationSummaryBufferMemory(
+        llm=llm,
+        chat_memory=chat_memory,
+        max_token_limit=ct.MEMORY_MAX_TOKEN_LIMIT,
+        return_messages=True
+    )
+
+
+def run_session(backend, turns, ms_per_1k_tokens, seed):
+    rng = random.Random(seed)
+    llm = FakeTutorModel(ms_per_1k_tokens=ms_per_1k_tokens)
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION),
+        MessagesPlaceholder(variable_name="history"),
+        HumanMessagePromptTemplate.from_template("{input}")
+    ])
+    chain = ConversationChain(llm=llm, memory=build_memory(backend, llm), prompt=prompt)
+
+    results = []
+    for _ in range(turns):
+        user_text = (
+            f"Yesterday I goes to the {rng.choice(PLACES)} with my {rng.choice(PEOPLE)} "
+            f"and we talked about {rng.choice(THINGS)} for a long time."
+        )
+        call_start = len(llm.calls)
+        started = time.perf_counter()
+        chain.predict(input=user_text)
+        elapsed = time.perf_counter() - started
+
+        calls = llm.calls[call_start:]
+        results.append({
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls if not c["summary"]),
+            "summary_calls": sum(1 for c in calls if c["summary"]),
+            "latency": elapsed,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=150.0, help="疑似LLMのトークン1000個あたりの処理時間")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checkpoints = sorted({n for n in (10, 25, 50, 100, 200, 500, args.turns) if n <= args.turns})
+    print(f"{'backend':<10} {'turn':>5} {'prompt_tokens':>14} {'avg_latency_ms':>15} {'summary_calls':>14}")
+    for backend in (ct.MEMORY_BACKEND_SUMMARY, ct.MEMORY_BACKEND_RETRIEVAL):
+        results = run_session(backend, args.turns, args.ms_per_1k_tokens, args.seed)
+        for n in checkpoints:
+            # 直近10ターンの平均を表示
+            window = results[max(n - 10, 0):n]
+            avg_latency = sum(r["latency"] for r in window) / len(window) * 1000
+            summary_calls = sum(r["summary_calls"] for r in results[:n])
+            print(f"{backend:<10} {n:>5} {results[n - 1]['prompt_tokens']:>14} {avg_latency:>15.1f} {summary_calls:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+シャドーイング音響評価（特徴量抽出＋バンド付きDTW）の処理時間ベンチマーク
+
+  python benchmarks/bench_shadowing.py --repeat 50
+
+約15語（約5秒）の疑似音声を合成し、参照音声の特徴量はキャッシュ済みとして
+学習者音声の特徴量抽出とスコア計算にかかる時間を計測する。
+
+スコアの換算基準（constants.pyのSHADOWING_UNRELATED_DISTANCE / SHADOWING_MATCHED_DISTANCE）は
+複数のシード・話し方（速さ・声の高さ・雑音）で「同じ文」「別の文」の平均距離を計測して決めている。
+
+  python benchmarks/bench_shadowing.py --calibration-seeds 20
+
+計測結果（seed 0〜19、3種類の話し方、各60組）:
+  同じ文: 距離 5% 0.455 / 中央値 0.533 / 95% 0.602 → スコア 5% 41.7 / 中央値 90.9 / 95% 100.0
+  別の文: 距離 5% 0.661 / 中央値 0.709 / 95% 0.775 → スコア 0.0（全件）
+→ 別の文の5%点（0.66）を0点、同じ文の中央値が約90点となる距離（0.52）を100点とする。
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import constants as ct
+import shadowing
+
+
+def synthesize_sentence(rng, words, stretch=1.0, pitch=120.0, noise=0.0):
+    """
+    単語ごとに異なるフォルマントを持つ疑似音声を合成
+    Args:
+        words: 単語ごとの (第1フォルマント, 第2フォルマント, 長さ秒) のリスト
+        stretch: 発話速度の倍率（1.0より大きいとゆっくり）
+        pitch: 基本周波数
+        noise: 加える雑音の大きさ
+    """
+    sample_rate = ct.SHADOWING_SAMPLE_RATE
+    pieces = [np.zeros(int(0.3 * sample_rate))]
+    for formant1, formant2, duration in words:
+        t = np.arange(int(duration * stretch * sample_rate)) / sample_rate
+        envelope = np.sin(np.pi * t / t[-1]) ** 2
+        voice = sum(
+            np.sin(2 * np.pi * pitch * k * t) / k
+            * (np.exp(-((pitch * k - formant1) / 150) ** 2) + np.exp(-((pitch * k - formant2) / 200) ** 2))
+            for k in range(1, 30)
+        )
+        pieces.append(envelope * voice)
+        pieces.append(np.zeros(int(0.08 * stretch * sample_rate)))
+    pieces.append(np.zeros(int(0.3 * sample_rate)))
+
+    samples = np.concatenate(pieces)
+    samples += noise * rng.standard_normal(len(samples))
+    return (samples / np.abs(samples).max() * 0.8).astype(np.float32)
+
+
+def random_words(rng, count=15):
+    return [(rng.uniform(300, 900), rng.uniform(900, 2500), rng.uniform(0.18, 0.35)) for _ in range(count)]
+
+
+# 学習者の話し方（発話速度の倍率, 声の高さ, 雑音）
+SPEAKING_STYLES = [(1.15, 180.0, 0.02), (0.9, 100.0, 0.05), (1.0, 150.0, 0.01)]
+
+
+def calibrate(seeds):
+    """
+    同じ文・別の文の平均距離とスコアの分布を出力
+    """
+    distances = {"same": [], "different": []}
+    scores = {"same": [], "different": []}
+    for seed in range(seeds):
+        rng = np.random.default_rng(seed)
+        words = random_words(rng)
+        reference_features = shadowing.extract_features(synthesize_sentence(rng, words))
+        for stretch, pitch, noise in SPEAKING_STYLES:
+            for label, learner_words in (("same", words), ("different", random_words(rng))):
+                learner = synthesize_sentence(rng, learner_words, stretch=stretch, pitch=pitch, noise=noise)
+                result = shadowing.score_shadowing(reference_features, shadowing.extract_features(learner))
+                if result["distance"] is not None:
+                    distances[label].append(result["distance"])
+                scores[label].append(result["score"])
+
+    print(f"{'sentence':<10} {'n':>4} {'dist_p5':>8} {'dist_p50':>9} {'dist_p95':>9} {'score_p5':>9} {'score_p50':>10} {'score_p95':>10}")
+    for label in ("same", "different"):
+        d = np.percentile(distances[label], [5, 50, 95])
+        s = np.percentile(scores[label], [5, 50, 95])
+        print(f"{label:<10} {len(scores[label]):>4} {d[0]:>8.3f} {d[1]:>9.3f} {d[2]:>9.3f} {s[0]:>9.1f} {s[1]:>10.1f} {s[2]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calibration-seeds", type=int, default=0, help="指定した場合はスコアの換算基準の計測のみ行う")
+    args = parser.parse_args()
+
+    if args.calibration_seeds:
+        calibrate(args.calibration_seeds)
+        return
+
+    rng = np.random.default_rng(args.seed)
+    words = random_words(rng)
+    reference = synthesize_sentence(rng, words)
+    shadow = synthesize_sentence(rng, words, stretch=1.15, pitch=180.0, noise=0.02)
+    unrelated = synthesize_sentence(rng, random_words(rng), stretch=1.15, pitch=180.0, noise=0.02)
+
+    # 参照音声の特徴量は問題生成時に一度だけ計算される
+    reference_features = shadowing.extract_features(reference)
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = shadowing.score_shadowing(reference_features, shadowing.extract_features(shadow))
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings = np.array(timings)
+    print(f"audio: reference {len(reference) / ct.SHADOWING_SAMPLE_RATE:.2f}s, learner {len(shadow) / ct.SHADOWING_SAMPLE_RATE:.2f}s")
+    print(f"features+DTW: median {np.median(timings):.1f} ms, p95 {np.percentile(timings, 95):.1f} ms, max {timings.max():.1f} ms")
+    print(f"same sentence:      {result}")
+    print(f"different sentence: {shadowing.score_shadowing(reference_features, shadowing.extract_features(unrelated))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+会話記録の保持方式ごとのメモリ使用量・保存時間の比較
+
+  python benchmarks/bench_turn_history.py --turns 200
+
+従来方式（画面表示用の辞書2件＋会話メモリ内のLangChainメッセージ2件）と、
+Turn（画面表示と会話メモリで共有）について、1往復あたりのメモリ使用量と
+退避時のJSON変換時間を計測する（メモリ使用量はセッションの計測と同じ概算方法）。
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, messages_to_dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from session_manager import estimate_size
+from turn_history import TurnChatMessageHistory
+
+
+def generate_texts(rng, turns):
+    texts = []
+    for i in range(turns):
+        user_text = f"Yesterday I goes to the park with my friend and we talked about {rng.random():.6f} things."
+        reply_text = f"That sounds fun! You could say \"I went to the park\" instead. What did you talk about? ({i})"
+        texts.append((user_text, reply_text, f"audio/output/audio_saved_{1700000000 + i}.wav"))
+    return texts
+
+
+def build_legacy(texts):
+    messages = []
+    chat_memory = InMemoryChatMessageHistory()
+    for user_text, reply_text, audio_path in texts:
+        messages.append({"role": "user", "content": user_text})
+        messages.append({"role": "assistant", "content": reply_text, "audio_path": audio_path})
+        chat_memory.add_messages([HumanMessage(content=user_text), AIMessage(content=reply_text)])
+    return messages, chat_memory
+
+
+def build_turns(texts):
+    turns = []
+    chat_memory = TurnChatMessageHistory(turns)
+    for user_text, reply_text, audio_path in texts:
+        chat_memory.add_messages([HumanMessage(content=user_text), AIMessage(content=reply_text)])
+        turns[-1].audio_path = audio_path
+    return turns, chat_memory
+
+
+def measure(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = generate_texts(random.Random(args.seed), args.turns)
+    # 文字列自体はどちらの方式でも同じため、計測から除く
+    text_bytes = sum(sys.getsizeof(text) for values in texts for text in values)
+
+    legacy_messages, legacy_memory = build_legacy(texts)
+    turns, _ = build_turns(texts)
+    legacy_bytes = estimate_size((legacy_messages, legacy_memory)) - text_bytes
+    turn_bytes = estimate_size(turns) - text_bytes
+
+    legacy_ms = measure(
+        lambda: json.dumps({"messages": legacy_messages, "memory": messages_to_dict(legacy_memory.messages)}),
+        args.repeat
+    )
+    turn_ms = measure(lambda: json.dumps({"turns": [turn.to_list() for turn in turns]}), args.repeat)
+
+    print(f"{'layout':<10} {'bytes/turn':>11} {'serialize_ms':>13}")
+    print(f"{'legacy':<10} {legacy_bytes / args.turns:>11.0f} {legacy_ms:>13.2f}")
+    print(f"{'turn':<10} {turn_bytes / args.turns:>11.0f} {turn_ms:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
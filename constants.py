@@ -5,8 +5,83 @@ USER_ICON_PATH = "images/user_icon.jpg"
 AI_ICON_PATH = "images/ai_icon.jpg"
 AUDIO_INPUT_DIR = "audio/input"
 AUDIO_OUTPUT_DIR = "audio/output"
+AUDIO_STATIC_DIR = "audio/static"
 PLAY_SPEED_OPTION = [2.0, 1.5, 1.2, 1.0, 0.8, 0.6]
 
+# 再読み上げ音声の配信サーバー設定（環境変数AUDIO_SERVER_PORT / AUDIO_SERVER_PUBLIC_URLで上書き可能）
+AUDIO_SERVER_HOST = "127.0.0.1"  # 既定ではこの端末からのみ接続を受け付ける
+AUDIO_SERVER_PUBLIC_HOST = "0.0.0.0"  # AUDIO_SERVER_PUBLIC_URLが指定されている場合のみ全インターフェースで待ち受ける
+AUDIO_SERVER_PORT = 8502
+AUDIO_SERVER_URL_PREFIX = "media"
+AUDIO_CACHE_MAX_AGE = 31536000  # 1年（ファイル名がコンテンツハッシュのため不変）
+AUDIO_STREAM_CHUNK_SIZE = 4096  # 音声合成のストリーミング受信サイズ（バイト）
+AUDIO_STREAM_WAIT_TIMEOUT = 30  # ストリーミング配信で次のデータを待つ最大秒数
+AUDIO_STREAM_RETENTION = 60  # 受信完了後にストリームを保持する秒数
+AUDIO_STREAM_MAX_AGE = 180  # 受信が完了しないまま残ったストリームを破棄するまでの秒数（ターン全体の制限時間より長く）
+AUDIO_STATIC_MAX_FILES = 500  # 配信ディレクトリに保持するファイル数の上限（超過時は最も古く使われたものから削除）
+AUDIO_STATIC_MAX_AGE_SEC = 86400  # 配信ディレクトリのファイルを保持する期間（最後に使われてからの秒数）
+AUDIO_DIGEST_CACHE_MAX_ENTRIES = 1024  # ファイル内容のハッシュ値のメモの上限件数
+
+# 会話メモリの設定（環境変数MEMORY_BACKENDで上書き可能）
+MEMORY_BACKEND_SUMMARY = "summary"  # 要約＋バッファ（ConversationSummaryBufferMemory）
+MEMORY_BACKEND_RETRIEVAL = "retrieval"  # 直近K往復＋BM25検索（RetrievalBufferMemory）
+MEMORY_BACKEND = MEMORY_BACKEND_SUMMARY
+MEMORY_MAX_TOKEN_LIMIT = 1000  # 要約メモリのバッファ上限トークン数
+MEMORY_RECENT_TURNS = 3  # 検索メモリでそのまま保持する直近の往復数
+MEMORY_TOKEN_BUDGET = 600  # 検索メモリで履歴に使うトークン数の上限
+
+# シャドーイングの音響評価（対数メルスペクトログラム＋DTW）の設定
+SHADOWING_SAMPLE_RATE = 16000
+SHADOWING_WINDOW_SEC = 0.025  # 分析窓の長さ
+SHADOWING_HOP_SEC = 0.010  # フレーム間隔
+SHADOWING_N_MELS = 40  # メル帯域数
+SHADOWING_SILENCE_DB = 35  # 最大エネルギーからこのdB以上小さいフレームを無音とみなす
+SHADOWING_DTW_BAND = 0.15  # Sakoe-Chibaバンド幅（系列長に対する割合）
+# スコアの基準となるフレーム間の平均コサイン距離（benchmarks/bench_shadowing.py --calibration-seeds で計測）
+SHADOWING_UNRELATED_DISTANCE = 0.66  # 0点（別の文を話した場合の距離の下位5%）
+SHADOWING_MATCHED_DISTANCE = 0.52  # 100点（同じ文のシャドーイングの中央値が約90点となる距離）
+SHADOWING_PROBLEM_HISTORY_TURNS = 5  # 問題文の生成時に履歴として含める直近の問題数
+
+# ターン処理（音声認識→応答生成→音声合成→変換）の制限時間
+TURN_DEADLINE_SEC = 90  # ターン全体の制限時間
+STAGE_TIMEOUTS = {  # ステージ毎のタイムアウト秒数
+    "transcribe": 30,
+    "chat": 30,
+    "tts": 30,
+    "transcode": 15,
+    "persist": 30,
+    "problem": 30,
+}
+STAGE_LABELS = {
+    "transcribe": "音声認識",
+    "chat": "AI応答生成",
+    "tts": "音声合成",
+    "transcode": "音声変換",
+    "persist": "会話履歴の保存",
+    "problem": "問題文の生成",
+}
+PIPELINE_MAX_WORKERS = 16  # CPU処理・同期APIのステージを実行するワーカースレッド数（全セッション共有）
+# イベントループで実行するステージのSDK側の再試行回数（接続エラー・429・5xx）
+# ステージのタイムアウトでコルーチンごと取り消されるため、再試行はステージの制限時間内に収まる
+# ワーカースレッドで実行する同期呼び出しは途中で中止できないため、再試行しない（max_retries=0）
+OPENAI_MAX_RETRIES = 2
+PIPELINE_POLL_INTERVAL = 0.2  # ステージ完了を待つ間隔（この間隔で中止操作を受け付ける）
+
+# プロファイル設定（環境変数APP_PROFILE、またはクエリパラメータ ?profile=1 で有効化）
+PROFILE_DIR = "profiles"  # 環境変数APP_PROFILE_DIRで上書き可能
+PROFILE_SAMPLE_INTERVAL = 0.005  # スタックのサンプリング間隔（秒）
+
+# 文字起こし結果のキャッシュ設定（全セッション共有）
+TRANSCRIPT_CACHE_MAX_ENTRIES = 512  # 保持する件数の上限（超過時は最も古く使われたものから削除）
+TRANSCRIPT_CACHE_TTL_SEC = 3600  # 保持期間（秒）
+TRANSCRIPT_CACHE_SAMPLE_RATE = 16000  # 指紋計算用に正規化するサンプリングレート
+
+# アイドルセッションの退避設定
+SESSION_IDLE_TIMEOUT_SEC = 600  # この時間操作がないセッションの重いオブジェクトを解放（環境変数SESSION_IDLE_TIMEOUT_SECで上書き可能）
+SESSION_SWEEP_INTERVAL_SEC = 60  # アイドル判定・メモリ使用量の計測間隔
+SESSION_OFFLOAD_DIR = "sessions"  # 会話履歴の退避先
+SESSION_SIZE_MAX_OBJECTS = 200000  # メモリ使用量の計測で辿るオブジェクト数の上限
+
 # 英語講師として自由な会話をさせ、文法間違いをさりげなく訂正させるプロンプト
 SYSTEM_TEMPLATE_BASIC_CONVERSATION = """
     You are a conversational English tutor. Engage in a natural and free-flowing conversation with the user. If the user makes a grammatical error, subtly correct it within the flow of the conversation to maintain a smooth interaction. Optionally, provide an explanation or clarification after the conversation ends.
@@ -1,10 +1,13 @@
 import streamlit as st
 import os
+import asyncio
 import time
+import uuid
 from pathlib import Path
 import wave
 import pyaudio
 from pydub import AudioSegment
+from streamlit.components.v1 import html
 from audio_recorder_streamlit import audio_recorder
 import numpy as np
 from scipy.io.wavfile import write
@@ -14,9 +17,15 @@ from langchain.prompts import (
     MessagesPlaceholder,
 )
 from langchain.schema import SystemMessage
-from langchain.memory import ConversationSummaryBufferMemory
+from langchain.memory import ConversationSummaryBufferMemory, ConversationBufferWindowMemory
 from langchain_openai import ChatOpenAI
 from langchain.chains import ConversationChain
+import audio_server
+import shadowing
+import transcript_cache
+from profiling import profiled
+from retrieval_memory import RetrievalBufferMemory
+from turn_history import TurnChatMessageHistory
 import constants as ct
 
 def record_audio_simple(key_suffix=""):
@@ -36,33 +45,26 @@ def record_audio_simple(key_suffix=""):
         st.session_state["global_microphone_permission"] = False
     
     # 処理中かどうかに応じてヒントテキストを変更
+    # 処理中も録音可能とし、新しい録音があれば処理中のターンを中止して置き換える
     if st.session_state.get("current_step", "waiting") == "processing":
-        button_text = "⏳ 処理中..."
-        is_disabled = True
+        button_text = "⏳ 処理中... (録音すると現在の処理を中止)"
+    elif not st.session_state["global_microphone_permission"]:
+        button_text = "🎤 マイクアクセス許可 (初回のみ)"
     else:
-        if not st.session_state["global_microphone_permission"]:
-            button_text = "🎤 マイクアクセス許可 (初回のみ)"
-        else:
-            button_text = "🎤 録音開始 / 🛑 録音停止"
-        is_disabled = False
+        button_text = "🎤 録音開始 / 🛑 録音停止"
     
     # 録音コンポーネントを表示（常に同じキーを使用）
-    if not is_disabled:
-        audio_data = audio_recorder(
-            text=button_text,
-            recording_color="#e8b62c",
-            neutral_color="#6aa36f", 
-            icon_name="microphone-lines",
-            icon_size="2x",
-            key=recorder_key,  # シンプルなキー管理
-            energy_threshold=(-1.0, 1.0),
-            pause_threshold=300.0,  # 5分間（実質的に自動停止を無効化）
-            sample_rate=41_000
-        )
-    else:
-        # 処理中は無効化されたコンポーネントを表示
-        st.info("⏳ 音声処理中です... 完了までお待ちください")
-        audio_data = None
+    audio_data = audio_recorder(
+        text=button_text,
+        recording_color="#e8b62c",
+        neutral_color="#6aa36f", 
+        icon_name="microphone-lines",
+        icon_size="2x",
+        key=recorder_key,  # シンプルなキー管理
+        energy_threshold=(-1.0, 1.0),
+        pause_threshold=300.0,  # 5分間（実質的に自動停止を無効化）
+        sample_rate=41_000
+    )
     
     # マイクアクセス許可の状態管理
     if audio_data is not None and not st.session_state["global_microphone_permission"]:
@@ -71,6 +73,7 @@ def record_audio_simple(key_suffix=""):
     
     return audio_data
 
+@profiled
 def save_audio_to_file(audio_data, file_path):
     """
     音声データをファイルに保存
@@ -111,19 +114,35 @@ def save_audio_to_file(audio_data, file_path):
         st.error(f"音声ファイル保存エラー: {e}")
         return False
 
-def transcribe_audio(audio_input_file_path):
+@profiled
+def transcribe_audio(audio_input_file_path, openai_obj=None, timeout=None):
     """
     音声入力ファイルから文字起こしテキストを取得
     Args:
         audio_input_file_path: 音声入力ファイルのパス
+        openai_obj: OpenAIのオブジェクト（未指定の場合はセッションのオブジェクト）
+        timeout: HTTPリクエストのタイムアウト秒数
     """
+    if openai_obj is None:
+        openai_obj = st.session_state.openai_obj
+    if timeout:
+        # 再試行するとステージのタイムアウトを超えてワーカーを占有するため、再試行しない
+        openai_obj = openai_obj.with_options(timeout=timeout, max_retries=0)
+
     try:
+        # 同じ音声（再試行・再送信）の場合はアップロードせずに前回の結果を再利用
+        fingerprint = transcript_cache.fingerprint_audio(audio_input_file_path, "whisper-1", "en")
+        transcript = transcript_cache.get_transcript(fingerprint)
+        if transcript is not None:
+            return transcript
+
         with open(audio_input_file_path, 'rb') as audio_input_file:
-            transcript = st.session_state.openai_obj.audio.transcriptions.create(
+            transcript = openai_obj.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_input_file,
                 language="en"
             )
+        transcript_cache.put_transcript(fingerprint, transcript)
         
         return transcript
     except Exception as e:
@@ -134,6 +153,44 @@ def transcribe_audio(audio_input_file_path):
         if os.path.exists(audio_input_file_path):
             os.remove(audio_input_file_path)
 
+@profiled
+async def transcribe_audio_async(audio_input_file_path, async_openai_obj, timeout=None):
+    """
+    音声入力ファイルから文字起こしテキストを取得（共有のイベントループで実行するコルーチン）
+    Args:
+        audio_input_file_path: 音声入力ファイルのパス
+        async_openai_obj: AsyncOpenAIのオブジェクト
+        timeout: HTTPリクエストのタイムアウト秒数
+    """
+    if timeout:
+        # 再試行はステージのタイムアウトでコルーチンごと取り消されるため、制限時間内に収まる
+        async_openai_obj = async_openai_obj.with_options(timeout=timeout, max_retries=ct.OPENAI_MAX_RETRIES)
+
+    try:
+        # 指紋の計算（音声のデコード）はイベントループを止めないよう別スレッドで実行
+        fingerprint = await asyncio.to_thread(
+            transcript_cache.fingerprint_audio, audio_input_file_path, "whisper-1", "en"
+        )
+        transcript = transcript_cache.get_transcript(fingerprint)
+        if transcript is not None:
+            return transcript
+
+        with open(audio_input_file_path, 'rb') as audio_input_file:
+            audio_data = audio_input_file.read()
+        transcript = await async_openai_obj.audio.transcriptions.create(
+            model="whisper-1",
+            file=(os.path.basename(audio_input_file_path), audio_data),
+            language="en"
+        )
+        transcript_cache.put_transcript(fingerprint, transcript)
+
+        return transcript
+    finally:
+        # ファイルが存在する場合のみ削除
+        if os.path.exists(audio_input_file_path):
+            os.remove(audio_input_file_path)
+
+@profiled
 def save_to_wav(llm_response_audio, audio_output_file_path):
     """
     一旦mp3形式で音声ファイル作成後、wav形式に変換
@@ -142,7 +199,8 @@ def save_to_wav(llm_response_audio, audio_output_file_path):
         audio_output_file_path: 出力先のファイルパス
     """
 
-    temp_audio_output_filename = f"{ct.AUDIO_OUTPUT_DIR}/temp_audio_output_{int(time.time())}.mp3"
+    # 並列実行時に衝突しないよう一意なファイル名を使用
+    temp_audio_output_filename = f"{ct.AUDIO_OUTPUT_DIR}/temp_audio_output_{uuid.uuid4().hex}.mp3"
     with open(temp_audio_output_filename, "wb") as temp_audio_output_file:
         temp_audio_output_file.write(llm_response_audio)
     
@@ -152,6 +210,7 @@ def save_to_wav(llm_response_audio, audio_output_file_path):
     # 音声出力用に一時的に作ったmp3ファイルを削除
     os.remove(temp_audio_output_filename)
 
+@profiled
 def play_wav(audio_output_file_path, speed=1.0):
     """
     音声ファイルの読み上げ
@@ -197,52 +256,205 @@ def play_wav(audio_output_file_path, speed=1.0):
     # LLMからの回答の音声ファイルを削除
     os.remove(audio_output_file_path)
 
-def create_chain(system_template):
+def create_memory(llm, turns):
+    """
+    会話メモリの作成（環境変数MEMORY_BACKENDで方式を切り替え）
+    Args:
+        llm: 要約生成・トークン数計算に使用するLLM
+        turns: 会話記録（Turn）のリスト。画面表示と共有し、会話メモリはこのリストを履歴として参照する
+    """
+
+    chat_memory = TurnChatMessageHistory(turns)
+    backend = os.environ.get("MEMORY_BACKEND", ct.MEMORY_BACKEND)
+    if backend == ct.MEMORY_BACKEND_RETRIEVAL:
+        return RetrievalBufferMemory(
+            llm=llm,
+            chat_memory=chat_memory,
+            recent_turns=ct.MEMORY_RECENT_TURNS,
+            token_budget=ct.MEMORY_TOKEN_BUDGET,
+            return_messages=True
+        )
+
+    return ConversationSummaryBufferMemory(
+        llm=llm,
+        chat_memory=chat_memory,
+        max_token_limit=ct.MEMORY_MAX_TOKEN_LIMIT,
+        return_messages=True
+    )
+
+def export_memory(memory):
+    """
+    会話メモリの状態を退避用の辞書（JSON形式で保存可能）に変換
+    - 会話記録（Turn）自体は画面表示側で保存するため、要約の状態のみを対象とする
+    Args:
+        memory: create_memoryで作成した会話メモリ
+    Returns:
+        dict: 会話メモリの状態
+    """
+
+    return {
+        "summary": getattr(memory, "moving_summary_buffer", ""),
+        "summarized_messages": memory.chat_memory.summarized_messages,
+    }
+
+def import_memory(memory, data):
+    """
+    export_memoryで変換した状態を会話メモリに復元（会話記録のリストを復元した後に呼び出す）
+    Args:
+        memory: 復元先の会話メモリ（create_memoryで作成したもの）
+        data: export_memoryの戻り値
+    """
+
+    memory.chat_memory.summarized_messages = data["summarized_messages"]
+    if isinstance(memory, ConversationSummaryBufferMemory):
+        memory.moving_summary_buffer = data["summary"]
+    elif isinstance(memory, RetrievalBufferMemory):
+        memory.rebuild_index()
+
+def create_chain(system_template, llm=None, memory=None):
     """
     LLMによる回答生成用のChain作成
+    Args:
+        system_template: システムプロンプト
+        llm: 使用するLLM（未指定の場合はセッションのLLM）
+        memory: 会話メモリ（未指定の場合はセッションのメモリ）
     """
 
+    if llm is None:
+        llm = st.session_state.llm
+    if memory is None:
+        memory = st.session_state.memory
+
     prompt = ChatPromptTemplate.from_messages([
         SystemMessage(content=system_template),
         MessagesPlaceholder(variable_name="history"),
         HumanMessagePromptTemplate.from_template("{input}")
     ])
     chain = ConversationChain(
-        llm=st.session_state.llm,
-        memory=st.session_state.memory,
+        llm=llm,
+        memory=memory,
         prompt=prompt
     )
 
     return chain
 
-def create_problem_and_play_audio():
+@profiled
+async def generate_reply(chain, user_text):
+    """
+    会話メモリの履歴を含めてLLMの応答を生成（共有のイベントループで実行するコルーチン）
+    - 会話メモリへの保存は行わない（save_turn_contextで音声合成と並行して保存する）
+    Args:
+        chain: create_chainで作成したChain
+        user_text: ユーザーの発話
+    Returns:
+        str: LLMの応答
+    """
+    memory_variables = await chain.memory.aload_memory_variables({"input": user_text})
+    messages = chain.prompt.format_messages(input=user_text, **memory_variables)
+    response = await chain.llm.ainvoke(messages)
+
+    return response.content
+
+@profiled
+def save_turn_context(memory, user_text, reply_text):
+    """
+    1往復分の会話を会話メモリに保存（要約メモリの場合は要約の更新を含む）
+    - トークン数の計算・要約の生成を同期的に行うため、ワーカースレッドで実行する
+    """
+    memory.save_context({"input": user_text}, {"response": reply_text})
+
+def create_problem_chain(llm=None):
+    """
+    シャドーイングの問題文生成用のChain作成
+    - 会話記録（Turn）とは別のメモリに直近の問題文のみを保持し、同じ問題文の繰り返しを避ける
+    Args:
+        llm: 使用するLLM（未指定の場合はセッションのLLM）
+    """
+    memory = ConversationBufferWindowMemory(k=ct.SHADOWING_PROBLEM_HISTORY_TURNS, return_messages=True)
+
+    return create_chain(ct.SYSTEM_TEMPLATE_CREATE_PROBLEM, llm=llm, memory=memory)
+
+@profiled
+def create_problem_and_play_audio(turn):
     """
     問題生成と音声ファイルの再生
+    - 問題文の生成・音声合成は共有のイベントループ、wav変換はワーカースレッドでステージとして実行
+    - 再生した音声はシャドーイング評価の参照音声として保存（次の問題文を生成するまで保持）
     Args:
-        chain: 問題文生成用のChain
-        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
-        openai_obj: OpenAIのオブジェクト
+        turn: ステージを実行するTurnPipeline（タイムアウト・中止はパイプライン側で判定）
+    Returns:
+        tuple: (問題文, 音声合成の結果のmp3データ)
     """
+    chain = st.session_state.chain_create_problem
+    async_openai_obj = st.session_state.async_openai_obj
 
-    # 問題文を生成するChainを実行し、問題文を取得
-    problem = st.session_state.chain_create_problem.predict(input="")
+    # 問題文を生成するChainの履歴（直近の問題文）を含めて問題文を生成
+    problem = turn.run_async_stage("problem", lambda stage: generate_reply(chain, ""))
+    chain.memory.save_context({"input": ""}, {"response": problem})
 
     # LLMからの回答を音声データに変換
-    llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-        model="tts-1",
-        voice="alloy",
-        input=problem
+    llm_response_audio = turn.run_async_stage(
+        "tts",
+        lambda stage: synthesize_speech_async(async_openai_obj, problem, timeout=stage.timeout)
     )
 
-    # 音声ファイルの作成
-    audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-    save_to_wav(llm_response_audio.content, audio_output_file_path)
+    # 音声ファイルの作成（複数のセッションで衝突しないよう一意なファイル名で）
+    audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{uuid.uuid4().hex}.wav"
+    turn.run_stage("transcode", lambda stage: save_to_wav(llm_response_audio, audio_output_file_path))
+
+    # 音声ファイルの読み上げ（再生用に保存したファイルを参照音声として使用）
+    reference_path = play_and_save_wav(audio_output_file_path, st.session_state.speed)
 
-    # 音声ファイルの読み上げ
-    play_wav(audio_output_file_path, st.session_state.speed)
+    # 前の問題文の参照音声を削除
+    previous_path = st.session_state.get("shadowing_reference_path")
+    if previous_path and previous_path != reference_path and os.path.exists(previous_path):
+        os.remove(previous_path)
+
+    # シャドーイング評価用に参照音声の特徴量を一度だけ計算して保持
+    # （アイドル時に特徴量が解放された場合は保存したファイルから再計算）
+    st.session_state.shadowing_reference = load_shadowing_features(reference_path)
+    st.session_state.shadowing_reference_path = reference_path
 
     return problem, llm_response_audio
 
+@profiled
+def load_shadowing_features(audio_file_path):
+    """
+    音声ファイルからシャドーイング評価用の特徴量を抽出
+    Args:
+        audio_file_path: 音声ファイルのパス
+    Returns:
+        np.ndarray: 対数メルスペクトログラム
+    """
+    audio = AudioSegment.from_file(audio_file_path)
+    audio = audio.set_channels(1).set_frame_rate(ct.SHADOWING_SAMPLE_RATE)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+
+    return shadowing.extract_features(samples, ct.SHADOWING_SAMPLE_RATE)
+
+@profiled
+def create_acoustic_evaluation(audio_input_file_path):
+    """
+    問題文の音声（TTS）とユーザーの音声を比較し、発音・タイミングを評価
+    - LLMを呼び出さずに端末内の計算のみで評価
+    Args:
+        audio_input_file_path: ユーザーの音声ファイルのパス
+    Returns:
+        dict: 評価結果（参照音声が未生成の場合はNone）
+    """
+    reference_features = st.session_state.get("shadowing_reference")
+    if reference_features is None:
+        reference_path = st.session_state.get("shadowing_reference_path")
+        if not reference_path or not os.path.exists(reference_path):
+            return None
+        reference_features = load_shadowing_features(reference_path)
+        st.session_state.shadowing_reference = reference_features
+
+    learner_features = load_shadowing_features(audio_input_file_path)
+    return shadowing.score_shadowing(reference_features, learner_features)
+
+@profiled
 def create_evaluation():
     """
     ユーザー入力値の評価生成
@@ -252,11 +464,138 @@ def create_evaluation():
 
     return llm_response_evaluation
 
-def play_audio_web_compatible(audio_file_path, speed=1.0):
+def use_audio_server():
+    """
+    再生音声を配信サーバーから配信するかを判定
+    - 配信サーバーのURLにブラウザから接続できない環境（localhost以外でAUDIO_SERVER_PUBLIC_URLが未指定）ではst.audioで再生
+    Returns:
+        bool: 配信サーバーを利用する場合True
+    """
+    headers = st.context.headers
+    # リバースプロキシ経由の場合はブラウザが指定したホストを優先
+    request_host = headers.get("X-Forwarded-Host") or headers.get("Host")
+    if not audio_server.is_reachable(request_host):
+        return False
+
+    return audio_server.start_audio_server()
+
+def render_audio_player(audio_url, autoplay=False, playback_rate=1.0):
+    """
+    HTTP配信された音声をブラウザの<audio>要素で再生
+    - Streamlitのメディアマネージャーを経由しないため、サーバーのメモリに音声を保持しない
+    - 同じURLであればブラウザキャッシュから再生される
+    Args:
+        audio_url: 音声ファイルのURL
+        autoplay: 自動再生する場合True
+        playback_rate: ブラウザ側での再生速度
+    """
+    autoplay_attr = " autoplay" if autoplay else ""
+    html(
+        f'<audio id="player" controls preload="auto"{autoplay_attr} src="{audio_url}" style="width: 100%;"></audio>'
+        f'<script>document.getElementById("player").playbackRate = {float(playback_rate)};</script>',
+        height=60
+    )
+
+def open_speech_stream(speed=1.0, container=None):
+    """
+    音声合成の結果を受信しながら再生するためのプレイヤーを表示
+    Args:
+        speed: 再生速度（ストリーミング中はブラウザ側のplaybackRateで調整）
+        container: プレイヤーを表示するコンテナ（st.empty()など）
+    Returns:
+        tuple: (ストリーミング再生のURL, AudioStream)（配信サーバーを利用しない場合は (None, None)）
+    """
+    if not use_audio_server():
+        return None, None
+
+    stream_url, audio_stream = audio_server.open_stream()
+    if container is not None:
+        with container:
+            render_audio_player(stream_url, autoplay=True, playback_rate=speed)
+    else:
+        render_audio_player(stream_url, autoplay=True, playback_rate=speed)
+
+    return stream_url, audio_stream
+
+@profiled
+def synthesize_speech(openai_obj, text, audio_stream=None, timeout=None, cancel_event=None):
+    """
+    音声合成の結果をストリーミングで受信
+    - 受信したデータは順次audio_streamに書き込み、全体の受信を待たずにブラウザで再生させる
+    - Streamlitに依存しないため、ワーカースレッドから呼び出し可能
+    Args:
+        openai_obj: OpenAIのオブジェクト
+        text: 読み上げるテキスト
+        audio_stream: 受信データの転送先（open_speech_streamの戻り値）
+        timeout: HTTPリクエストのタイムアウト秒数
+        cancel_event: セットされた場合に受信を中断するイベント
+    Returns:
+        bytes: 受信したmp3データ（中断された場合はNone）
+    """
+    audio_chunks = []
+    try:
+        # 再試行するとステージのタイムアウトを超えてワーカーを占有するため、再試行しない
+        client = openai_obj.with_options(timeout=timeout, max_retries=0) if timeout else openai_obj
+        with client.audio.speech.with_streaming_response.create(
+            model="tts-1",
+            voice="alloy",
+            input=text,
+            response_format="mp3"
+        ) as response:
+            for chunk in response.iter_bytes(chunk_size=ct.AUDIO_STREAM_CHUNK_SIZE):
+                if cancel_event is not None and cancel_event.is_set():
+                    # 接続を閉じて受信を打ち切る
+                    return None
+                audio_chunks.append(chunk)
+                if audio_stream is not None:
+                    audio_stream.write(chunk)
+    finally:
+        if audio_stream is not None:
+            audio_stream.close()
+
+    return b"".join(audio_chunks)
+
+@profiled
+async def synthesize_speech_async(async_openai_obj, text, audio_stream=None, timeout=None):
+    """
+    音声合成の結果をストリーミングで受信（共有のイベントループで実行するコルーチン）
+    - 受信したデータは順次audio_streamに書き込み、全体の受信を待たずにブラウザで再生させる
+    - 中止された場合はコルーチンの取り消しにより接続を閉じる
+    Args:
+        async_openai_obj: AsyncOpenAIのオブジェクト
+        text: 読み上げるテキスト
+        audio_stream: 受信データの転送先（open_speech_streamの戻り値）
+        timeout: HTTPリクエストのタイムアウト秒数
+    Returns:
+        bytes: 受信したmp3データ
+    """
+    audio_chunks = []
+    try:
+        # 再試行はステージのタイムアウトでコルーチンごと取り消されるため、制限時間内に収まる
+        client = async_openai_obj.with_options(timeout=timeout, max_retries=ct.OPENAI_MAX_RETRIES) if timeout else async_openai_obj
+        async with client.audio.speech.with_streaming_response.create(
+            model="tts-1",
+            voice="alloy",
+            input=text,
+            response_format="mp3"
+        ) as response:
+            async for chunk in response.iter_bytes(chunk_size=ct.AUDIO_STREAM_CHUNK_SIZE):
+                audio_chunks.append(chunk)
+                if audio_stream is not None:
+                    audio_stream.write(chunk)
+    finally:
+        if audio_stream is not None:
+            audio_stream.close()
+
+    return b"".join(audio_chunks)
+
+@profiled
+def play_audio_web_compatible(audio_file_path, speed=1.0, autoplay=False):
     """
     Webアプリ対応の音声再生（ブラウザ側再生）
     - localhost/クラウド環境の両方で動作
     - ブラウザの音声コントロールを使用
+    - 音声配信サーバーを利用しない場合（ブラウザから接続できない環境など）はst.audioで再生
     """
     try:
         print(f"[WEB] ブラウザ音声再生開始: {audio_file_path}")
@@ -266,12 +605,16 @@ def play_audio_web_compatible(audio_file_path, speed=1.0):
             print(f"[ERROR] 音声ファイルが見つかりません: {audio_file_path}")
             return False
         
+        if use_audio_server():
+            # 速度調整済みの音声もコンテンツハッシュ付きで配信（同じ速度の再読み上げは再変換しない）
+            audio_url = audio_server.publish_audio(audio_file_path, speed)
+            render_audio_player(audio_url, autoplay=autoplay)
+            print(f"[WEB] ブラウザ音声再生設定完了: {audio_url}")
+            return True
+
         # 速度調整が必要な場合は事前に処理
         playback_file = audio_file_path
         if speed != 1.0:
-            from pydub import AudioSegment
-            import time
-            
             print(f"[WEB] 速度調整処理: {speed}x")
             audio = AudioSegment.from_wav(audio_file_path)
             modified_audio = audio._spawn(
@@ -281,15 +624,12 @@ def play_audio_web_compatible(audio_file_path, speed=1.0):
             modified_audio = modified_audio.set_frame_rate(audio.frame_rate)
             
             # 一時ファイル作成
-            temp_path = audio_file_path.replace('.wav', f'_web_temp_{int(time.time())}.wav')
+            temp_path = audio_file_path.replace('.wav', f'_web_temp_{uuid.uuid4().hex}.wav')
             modified_audio.export(temp_path, format="wav")
             playback_file = temp_path
         
-        # Streamlitのst.audioでブラウザ再生
-        import streamlit as st
-        
         # 音声コントロール付きで表示
-        st.audio(playback_file, format="audio/wav")
+        st.audio(playback_file, format="audio/wav", autoplay=autoplay)
         
         # 一時ファイルがあれば遅延削除
         if speed != 1.0 and playback_file != audio_file_path:
@@ -310,10 +650,10 @@ def play_audio_web_compatible(audio_file_path, speed=1.0):
         
     except Exception as e:
         print(f"[ERROR] Web音声再生エラー: {e}")
-        if 'st' in globals():
-            st.error(f"音声再生エラー: {e}")
+        st.error(f"音声再生エラー: {e}")
         return False
 
+@profiled
 def play_audio_direct(audio_file_path, speed=1.0):
     """
     音声ファイルを直接再生（同期的、確実な再生）- macOS対応強化版
@@ -347,7 +687,7 @@ def play_audio_direct(audio_file_path, speed=1.0):
                 overrides={"frame_rate": int(audio.frame_rate * speed)}
             )
             modified_audio = modified_audio.set_frame_rate(audio.frame_rate)
-            temp_path = audio_file_path.replace('.wav', f'_temp_speed_{int(time.time())}.wav')
+            temp_path = audio_file_path.replace('.wav', f'_temp_speed_{uuid.uuid4().hex}.wav')
             modified_audio.export(temp_path, format="wav")
             playback_file = temp_path
             print(f"[DEBUG] 速度調整完了: {speed}x")
@@ -491,40 +831,24 @@ def save_for_replay(audio_output_file_path):
     except Exception as e:
         st.error(f"音声ファイル保存エラー: {e}")
 
+@profiled
 def play_and_save_wav(audio_output_file_path, speed=1.0):
     """
     音声ファイルの読み上げと再読み上げ用に保存
     Args:
         audio_output_file_path: 音声ファイルのパス
         speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
+    Returns:
+        str: 再読み上げ用に保存したファイルのパス
     """
 
-    # 音声ファイルの読み込み
-    audio = AudioSegment.from_wav(audio_output_file_path)
-    
-    # 速度を変更
-    if speed != 1.0:
-        # frame_rateを変更することで速度を調整
-        modified_audio = audio._spawn(
-            audio.raw_data, 
-            overrides={"frame_rate": int(audio.frame_rate * speed)}
-        )
-        # 元のframe_rateに戻すことで正常再生させる（ピッチを保持したまま速度だけ変更）
-        modified_audio = modified_audio.set_frame_rate(audio.frame_rate)
-
-        modified_audio.export(audio_output_file_path, format="wav")
-
     # 再読み上げ用にファイルを保存（元のファイルをコピー）
     saved_audio_path = audio_output_file_path.replace('.wav', '_saved.wav')
     audio_for_save = AudioSegment.from_wav(audio_output_file_path)
     audio_for_save.export(saved_audio_path, format="wav")
 
-    # PyAudioによる再生をStreamlitの音声再生に変更
-    try:
-        # Streamlitの音声再生機能を使用（非ブロッキング）
-        st.audio(audio_output_file_path, format="audio/wav", autoplay=True)
-    except Exception as e:
-        st.error(f"音声再生エラー: {e}")
+    # 配信サーバー経由でブラウザ再生（速度調整も配信側で実施）
+    play_audio_web_compatible(saved_audio_path, speed, autoplay=True)
     
     # 元の音声ファイルを削除（保存用は残す）
     if os.path.exists(audio_output_file_path):
@@ -533,6 +857,9 @@ def play_and_save_wav(audio_output_file_path, speed=1.0):
         except:
             pass  # ファイルが使用中の場合はスキップ
 
+    return saved_audio_path
+
+@profiled
 def play_saved_audio(saved_audio_path, speed=1.0):
     """
     保存された音声ファイルを再生
@@ -540,45 +867,9 @@ def play_saved_audio(saved_audio_path, speed=1.0):
         saved_audio_path: 保存された音声ファイルのパス
         speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
     """
-    try:
-        if not os.path.exists(saved_audio_path):
-            st.error("音声ファイルが見つかりません")
-            return
+    if not os.path.exists(saved_audio_path):
+        st.error("音声ファイルが見つかりません")
+        return
 
-        # 音声ファイルの読み込み
-        audio = AudioSegment.from_wav(saved_audio_path)
-        
-        # 一時的な再生用ファイルを作成
-        temp_play_path = saved_audio_path.replace('_saved.wav', f'_temp_play_{int(time.time())}.wav')
-        
-        # 速度を変更
-        if speed != 1.0:
-            # frame_rateを変更することで速度を調整
-            modified_audio = audio._spawn(
-                audio.raw_data, 
-                overrides={"frame_rate": int(audio.frame_rate * speed)}
-            )
-            # 元のframe_rateに戻すことで正常再生させる（ピッチを保持したまま速度だけ変更）
-            modified_audio = modified_audio.set_frame_rate(audio.frame_rate)
-            modified_audio.export(temp_play_path, format="wav")
-        else:
-            # 速度変更がない場合は元のファイルをコピー
-            audio.export(temp_play_path, format="wav")
-
-        # Streamlitの音声再生機能を使用
-        st.audio(temp_play_path, format="audio/wav", autoplay=True)
-        
-        # 少し待ってから一時ファイルを削除
-        import threading
-        def delayed_cleanup():
-            time.sleep(2)
-            if os.path.exists(temp_play_path):
-                try:
-                    os.remove(temp_play_path)
-                except:
-                    pass
-        
-        threading.Thread(target=delayed_cleanup, daemon=True).start()
-        
-    except Exception as e:
-        st.error(f"音声再生エラー: {e}")
\ No newline at end of file
+    # 同じ音声・同じ速度であれば同じURLとなり、ブラウザキャッシュから再生される
+    play_audio_web_compatible(saved_audio_path, speed, autoplay=True)
@@ -1,10 +1,10 @@
 import streamlit as st
 import os
-import time
+import hashlib
+import uuid
 from time import sleep
 from pathlib import Path
 from streamlit.components.v1 import html
-from langchain.memory import ConversationSummaryBufferMemory
 from langchain.chains import ConversationChain
 from langchain.prompts import (
     ChatPromptTemplate,
@@ -12,12 +12,15 @@ from langchain.prompts import (
     MessagesPlaceholder,
 )
 from langchain.schema import SystemMessage
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
-from pydub import AudioSegment
 import functions as ft
 import constants as ct
+import profiling
+import audio_server
+import pipeline
+import session_manager
 
 
 # 各種設定
@@ -26,12 +29,28 @@ st.set_page_config(
     page_title=ct.APP_NAME
 )
 
+# プロファイル開始（環境変数APP_PROFILE、またはクエリパラメータ ?profile=1 の場合のみ）
+profiling.begin_rerun()
+
+# セッションの最終操作時刻を更新（一定時間操作がないセッションは重いオブジェクトを解放）
+session_manager.touch()
+
 # タイトル表示
 st.markdown(f"## {ct.APP_NAME}")
 
+# ストリーミング再生のプレイヤー表示位置
+# 再実行後も同じ位置・同じURLで表示し続けることで、再生中のプレイヤーを維持する
+now_playing_container = st.empty()
+# 配信が終了したストリームのURLは表示しない（ブラウザが存在しないストリームを要求しないように）
+if st.session_state.get("now_playing") and not audio_server.has_stream(st.session_state.now_playing["audio_url"]):
+    st.session_state.now_playing = None
+if st.session_state.get("now_playing"):
+    with now_playing_container:
+        ft.render_audio_player(**st.session_state.now_playing)
+
 # 初期処理
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "turns" not in st.session_state:
+    st.session_state.turns = []  # 会話記録（Turn）のリスト。画面表示と会話メモリで共有
     st.session_state.mode = ct.MODE_1  # デフォルトモード
     st.session_state.speed = 1.0  # デフォルト速度
     st.session_state.current_step = "waiting"  # waiting, recording, processing
@@ -39,17 +58,29 @@ if "messages" not in st.session_state:
     
     # 録音コンポーネント用の初期化
     st.session_state.global_microphone_permission = False
-    
+
+# APIクライアント・LLM・会話メモリ・Chainの作成
+# （アイドル状態が続いて解放されたセッションの場合は、再作成して会話履歴を復元）
+if "chain_basic_conversation" not in st.session_state:
     st.session_state.openai_obj = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    st.session_state.llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.5)
-    st.session_state.memory = ConversationSummaryBufferMemory(
-        llm=st.session_state.llm,
-        max_token_limit=1000,
-        return_messages=True
+    # ターン処理のネットワーク呼び出しは共有のイベントループ上で非同期に実行
+    st.session_state.async_openai_obj = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    # 応答生成はイベントループで実行し、ステージのタイムアウトで取り消されるためSDK側の再試行を使用
+    st.session_state.llm = ChatOpenAI(
+        model_name="gpt-4o-mini",
+        temperature=0.5,
+        timeout=ct.STAGE_TIMEOUTS["chat"],
+        max_retries=ct.OPENAI_MAX_RETRIES
     )
+    # 要約の生成はワーカースレッドで同期的に実行され中止できないため、再試行しないLLMを使用
+    summary_llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.5, timeout=ct.STAGE_TIMEOUTS["persist"], max_retries=0)
+    st.session_state.memory = ft.create_memory(summary_llm, st.session_state.turns)
+    session_manager.restore_offloaded_session()
 
     # モード「日常英会話」用のChain作成
     st.session_state.chain_basic_conversation = ft.create_chain(ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION)
+    # モード「シャドーイング」の問題文生成用のChain作成
+    st.session_state.chain_create_problem = ft.create_problem_chain()
 
 # UI設定
 st.session_state.mode = st.selectbox(
@@ -97,38 +128,98 @@ else:
 
 st.divider()
 
-# メッセージリストの一覧表示（最新の会話のみ表示）
-if st.session_state.messages:
-    # 最新メッセージのみを表示
-    latest_messages = st.session_state.messages[-2:] if len(st.session_state.messages) >= 2 else st.session_state.messages
-    for idx, message in enumerate(latest_messages):
-        actual_idx = len(st.session_state.messages) - len(latest_messages) + idx
-        if message["role"] == "assistant":
-            with st.chat_message(message["role"], avatar="images/ai_icon.jpg"):
-                st.markdown(message["content"])
-                # 日常英会話モードでかつAIメッセージに音声ファイルが関連付けされている場合
-                if (st.session_state.mode == ct.MODE_1 and 
-                    "audio_path" in message and 
-                    message["audio_path"] and 
-                    os.path.exists(message["audio_path"])):
-                    
-                    col_msg_replay1, col_msg_replay2 = st.columns([1, 4])
-                    with col_msg_replay1:
-                        # 各メッセージ用の一意なキーを生成
-                        replay_key = f"replay_latest_{actual_idx}"
-                        if st.button("🔊 再読み上げ", key=replay_key, use_container_width=True):
-                            success = ft.play_audio_web_compatible(message["audio_path"], st.session_state.speed)
-                            if success:
-                                st.toast("音声を再生しました", icon="🔊")
-                            else:
-                                st.toast("音声再生に失敗しました", icon="❌")
-        elif message["role"] == "user":
-            with st.chat_message(message["role"], avatar="images/user_icon.jpg"):
-                st.markdown(message["content"])
+# 最新の会話（1往復）の表示
+if st.session_state.turns:
+    latest_idx = len(st.session_state.turns) - 1
+    latest_turn = st.session_state.turns[latest_idx]
+    with st.chat_message("user", avatar="images/user_icon.jpg"):
+        st.markdown(latest_turn.user_text)
+    if latest_turn.reply_text is not None:
+        with st.chat_message("assistant", avatar="images/ai_icon.jpg"):
+            st.markdown(latest_turn.reply_text)
+            # 日常英会話モードでかつAIメッセージに音声ファイルが関連付けされている場合
+            if (st.session_state.mode == ct.MODE_1 and
+                latest_turn.audio_path and
+                os.path.exists(latest_turn.audio_path)):
+
+                col_msg_replay1, col_msg_replay2 = st.columns([1, 4])
+                with col_msg_replay1:
+                    # 各メッセージ用の一意なキーを生成
+                    replay_key = f"replay_latest_{latest_idx}"
+                    if st.button("🔊 再読み上げ", key=replay_key, use_container_width=True):
+                        success = ft.play_audio_web_compatible(latest_turn.audio_path, st.session_state.speed)
+                        if success:
+                            st.toast("音声を再生しました", icon="🔊")
+                        else:
+                            st.toast("音声再生に失敗しました", icon="❌")
 
 # メイン機能
 st.markdown("### 🗣️ 音声英会話練習")
 
+# シャドーイング: お手本の音声（問題文）の生成・再生と、前回の録音の評価結果の表示
+if st.session_state.mode == ct.MODE_2:
+    reference_path = st.session_state.get("shadowing_reference_path")
+    has_reference = reference_path is not None and os.path.exists(reference_path)
+    col_problem, col_reference = st.columns(2)
+    with col_problem:
+        create_problem_clicked = st.button("▶️ 問題文を生成", key="create_problem", use_container_width=True)
+    with col_reference:
+        replay_reference_clicked = st.button("🔊 お手本を再生", key="replay_reference", use_container_width=True, disabled=not has_reference)
+
+    if create_problem_clicked:
+        # 各ステージの経過時間を表示（表示の更新時に中止操作が受け付けられる）
+        problem_status = st.empty()
+        def show_problem_status(stage, elapsed):
+            problem_status.caption(f"⏳ {ct.STAGE_LABELS[stage]}... {elapsed:.1f}秒")
+
+        try:
+            with st.spinner("問題文を生成中..."):
+                st.session_state.shadowing_problem, _ = ft.create_problem_and_play_audio(
+                    pipeline.TurnPipeline(on_wait=show_problem_status)
+                )
+            st.session_state.shadowing_result = None
+        except pipeline.StageTimeout as e:
+            if e.deadline_exceeded:
+                st.error("⏱️ 問題文の生成が制限時間を超えました。もう一度お試しください。")
+            else:
+                st.error(f"⏱️ {ct.STAGE_LABELS[e.stage]}がタイムアウトしました。もう一度お試しください。")
+        except Exception as e:
+            st.error(f"問題文の生成に失敗しました: {e}")
+        finally:
+            problem_status.empty()
+    elif replay_reference_clicked:
+        ft.play_audio_web_compatible(reference_path, st.session_state.speed, autoplay=True)
+
+    if st.session_state.get("shadowing_problem"):
+        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            st.markdown(st.session_state.shadowing_problem)
+            st.caption("お手本の音声に続けて同じ英文を発話し、録音してください。")
+
+    shadowing_result = st.session_state.get("shadowing_result")
+    if shadowing_result:
+        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+            st.markdown(shadowing_result["user_text"])
+        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            acoustic_evaluation = shadowing_result["evaluation"]
+            if acoustic_evaluation is not None:
+                st.markdown("**【音声の評価】**")
+                col_score, col_tempo, col_timing = st.columns(3)
+                col_score.metric("発音の一致度", f"{acoustic_evaluation['score']}点")
+                col_tempo.metric("話す速さ（お手本比）", f"{acoustic_evaluation['tempo_ratio']}倍")
+                if acoustic_evaluation["timing_error_sec"] is not None:
+                    col_timing.metric("タイミングのずれ", f"{acoustic_evaluation['timing_error_sec']}秒")
+            else:
+                st.info("お手本の音声がないため評価できませんでした。「▶️ 問題文を生成」でお手本を再生してから録音してください。")
+
+# 失敗したターンの再試行（同じ録音を再送信。音声認識が済んでいた場合は文字起こし結果のキャッシュを再利用）
+if st.session_state.get("retry_turn") and st.session_state.get("retry_audio"):
+    st.session_state.recorded_audio = st.session_state.retry_audio
+    st.session_state.current_step = "processing"
+
+# 処理中のターンが中断された場合（中止ボタン・新しい録音・その他の操作による再実行）は待機状態に戻す
+if st.session_state.current_step == "processing" and not st.session_state.recorded_audio:
+    st.session_state.current_step = "waiting"
+
 # 現在のステップ表示
 if st.session_state.current_step == "waiting":
     if st.session_state.get("global_microphone_permission", False):
@@ -155,15 +246,25 @@ elif st.session_state.current_step == "recording":
 elif st.session_state.current_step == "processing":
     st.info("⚙️ 音声を処理中... しばらくお待ちください")
 
-# 録音機能（常に表示、ただし処理中は無効化表示）
+# 録音機能（処理中も表示し、新しい録音で処理中のターンを置き換える）
 recorded_audio = ft.record_audio_simple("main")
 
+# 処理中のみ中止ボタンを表示（クリックによる再実行で処理中のターンが中止される）
+if st.session_state.current_step == "processing":
+    st.button("⏹ 処理を中止", key="cancel_turn")
+elif st.session_state.get("cancel_turn"):
+    st.toast("処理を中止しました", icon="⏹")
+elif st.session_state.get("retry_audio"):
+    st.button("🔁 同じ録音で再試行", key="retry_turn")
+
 # 録音データの処理
 if recorded_audio is not None and len(recorded_audio) > 50:  # 最小バイト数を緩和（100→50）
-    # 新しい録音データかつ、現在処理中でない場合のみ処理開始
-    if (st.session_state.recorded_audio != recorded_audio and 
-        st.session_state.current_step == "waiting"):
+    # 録音コンポーネントは前回の録音データを返し続けるため、ハッシュで新しい録音かを判定
+    recorded_audio_id = hashlib.sha1(recorded_audio).hexdigest()
+    if st.session_state.get("last_recorded_audio_id") != recorded_audio_id:
+        st.session_state.last_recorded_audio_id = recorded_audio_id
         st.session_state.recorded_audio = recorded_audio
+        st.session_state.retry_audio = None
         st.session_state.current_step = "processing"
         st.rerun()
 
@@ -172,95 +273,154 @@ if st.session_state.current_step == "processing" and st.session_state.recorded_a
     # 処理開始前に録音データをクリア（重複処理を防ぐ）
     current_audio = st.session_state.recorded_audio
     st.session_state.recorded_audio = None
+    st.session_state.retry_audio = None
     
     # 音声ファイルを保存
-    audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{int(time.time())}.wav"
+    audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{uuid.uuid4().hex}.wav"
     
     if ft.save_audio_to_file(current_audio, audio_input_file_path):
-        # 音声認識
-        with st.spinner('音声をテキストに変換中...'):
-            transcript = ft.transcribe_audio(audio_input_file_path)
-            audio_input_text = transcript.text
+        # シャドーイングの音響評価（音声認識後に入力ファイルが削除されるため先に実施）
+        acoustic_evaluation = None
+        if st.session_state.mode == ct.MODE_2:
+            acoustic_evaluation = ft.create_acoustic_evaluation(audio_input_file_path)
 
-        # ユーザー入力を表示
-        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
-            st.markdown(audio_input_text)
-
-        # モード別処理
-        if st.session_state.mode == ct.MODE_1:  # 日常英会話
-            # AI応答生成
-            with st.spinner("AI応答を生成中..."):
-                llm_response = st.session_state.chain_basic_conversation.predict(input=audio_input_text)
-                
-                # 音声合成
-                llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-                    model="tts-1",
-                    voice="alloy",
-                    input=llm_response
+        # 各ステージの経過時間を表示（表示の更新時に中止操作が受け付けられる）
+        stage_status = st.empty()
+        def show_stage_status(stage, elapsed):
+            stage_status.caption(f"⏳ {ct.STAGE_LABELS[stage]}... {elapsed:.1f}秒")
+
+        turn = pipeline.TurnPipeline(on_wait=show_stage_status)
+        async_openai_obj = st.session_state.async_openai_obj
+        chain = st.session_state.chain_basic_conversation
+        persist_stage = None
+
+        try:
+            # 音声認識
+            with st.spinner('音声をテキストに変換中...'):
+                transcript = turn.run_async_stage(
+                    "transcribe",
+                    lambda stage: ft.transcribe_audio_async(audio_input_file_path, async_openai_obj, timeout=stage.timeout)
                 )
+                audio_input_text = transcript.text
+
+            # ユーザー入力を表示
+            with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+                st.markdown(audio_input_text)
+
+            # モード別処理
+            if st.session_state.mode == ct.MODE_1:  # 日常英会話
+                # AI応答生成
+                with st.spinner("AI応答を生成中..."):
+                    # 中止・タイムアウトしたターンの保存が実行中の場合は完了を待つ
+                    # （要約・会話記録の更新が重ならないよう、会話メモリへの保存はセッション内で1つずつ実行）
+                    previous_persist_stage = st.session_state.get("persist_stage")
+                    if previous_persist_stage is not None:
+                        turn.wait_previous_stage(previous_persist_stage)
+
+                    llm_response = turn.run_async_stage(
+                        "chat",
+                        lambda stage: ft.generate_reply(chain, audio_input_text)
+                    )
+
+                    # 会話メモリへの保存（要約の更新を含む）は音声合成・変換と並行して実行
+                    # トークン数の計算（tiktoken）でイベントループを止めないよう、ワーカースレッドで実行
+                    # 表示した応答が会話履歴から抜けないよう、ターンの中止・タイムアウトでは取り消さない
+                    persist_stage = turn.start_stage(
+                        "persist",
+                        lambda stage: ft.save_turn_context(chain.memory, audio_input_text, llm_response),
+                        detach=True
+                    )
+                    st.session_state.persist_stage = persist_stage
+                    
+                    # AI応答を表示
+                    with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+                        st.markdown(llm_response)
+                        st.info("🔊 音声を自動再生中...")
+                    
+                    # 音声合成の結果を受信しながらブラウザで再生
+                    stream_url, audio_stream = ft.open_speech_stream(st.session_state.speed, container=now_playing_container)
+                    try:
+                        llm_response_audio = turn.run_async_stage(
+                            "tts",
+                            lambda stage: ft.synthesize_speech_async(
+                                async_openai_obj,
+                                llm_response,
+                                audio_stream=audio_stream,
+                                timeout=stage.timeout
+                            )
+                        )
+                    finally:
+                        # 音声合成の開始前・受信中に中止された場合も、配信側の待機を終了させる
+                        if audio_stream is not None:
+                            audio_stream.close()
+                    if stream_url:
+                        st.session_state.now_playing = {
+                            "audio_url": stream_url,
+                            "autoplay": True,
+                            "playback_rate": st.session_state.speed
+                        }
+                    
+                    # 再読み上げ用にwav形式で保存（一意なファイル名で）
+                    saved_audio_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_saved_{uuid.uuid4().hex}.wav"
+                    turn.run_stage(
+                        "transcode",
+                        lambda stage: ft.save_to_wav(llm_response_audio, saved_audio_path)
+                    )
+
+                    # 会話メモリへの保存時に追加された会話記録に音声ファイルを設定
+                    turn.wait_stage(persist_stage)
+                    st.session_state.turns[-1].audio_path = saved_audio_path
+                    
+                    # 配信サーバーが利用できない場合は保存したファイルを再生
+                    if not stream_url:
+                        ft.play_audio_web_compatible(saved_audio_path, st.session_state.speed, autoplay=True)
 
-                # 音声ファイル保存・再生
-                audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-                ft.save_to_wav(llm_response_audio.content, audio_output_file_path)
-                
-                # AI応答を表示
-                with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-                    st.markdown(llm_response)
-                    st.info("🔊 音声を自動再生中...")
-                
-                # Web標準のブラウザ音声再生（localhost/クラウド両対応）
-                print(f"[MAIN] Web音声再生開始: {audio_output_file_path}")
-                
-                # ブラウザでの音声再生
-                success = ft.play_audio_web_compatible(audio_output_file_path, st.session_state.speed)
-                
-                if success:
-                    st.success("🔊 音声再生完了（ブラウザ再生）")
-                else:
-                    st.error("❌ 音声再生に失敗しました")
-                
-                # 再読み上げ用ファイルを保存（一意なファイル名で）
-                timestamp = int(time.time())
-                saved_audio_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_saved_{timestamp}.wav"
-                audio_for_save = AudioSegment.from_wav(audio_output_file_path)
-                audio_for_save.export(saved_audio_path, format="wav")
-                
-                # このメッセージ専用の音声ファイルパスを保存
-                current_message_audio_path = saved_audio_path
-                
-                # 少し遅延してから元のファイルを削除
-                import threading
-                def delayed_cleanup():
-                    time.sleep(3)  # 3秒後に削除
-                    if os.path.exists(audio_output_file_path):
-                        try:
-                            os.remove(audio_output_file_path)
-                        except:
-                            pass
-                
-                threading.Thread(target=delayed_cleanup, daemon=True).start()
-
-            # メッセージ履歴に追加（正しい音声ファイルパスで）
-            st.session_state.messages.append({"role": "user", "content": audio_input_text})
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": llm_response,
-                "audio_path": current_message_audio_path
-            })
-
-        elif st.session_state.mode == ct.MODE_2:  # シャドーイング
-            # シャドーイング用の処理（簡素化）
-            st.info("シャドーイングモードは今後実装予定です")
+            elif st.session_state.mode == ct.MODE_2:  # シャドーイング
+                # 評価結果は再実行後にシャドーイングの表示欄で表示
+                st.session_state.shadowing_result = {
+                    "user_text": audio_input_text,
+                    "evaluation": acoustic_evaluation
+                }
+
+            turn.complete()
+            turn_failed = False
+        except pipeline.StageTimeout as e:
+            # タイムアウトの場合はエラーを表示したまま待機状態に戻す（再実行しない）
+            turn_failed = True
+            if e.deadline_exceeded:
+                failure_message = "⏱️ 処理の制限時間を超えました。"
+            else:
+                failure_message = f"⏱️ {ct.STAGE_LABELS[e.stage]}がタイムアウトしました。"
+        except Exception as e:
+            # APIエラー等の場合も同様に待機状態に戻す
+            turn_failed = True
+            failure_message = f"❌ 音声の処理に失敗しました（{e}）。"
+        finally:
+            # 入力ファイルが残っている場合（音声認識前に中止された場合など）は削除
+            if os.path.exists(audio_input_file_path):
+                os.remove(audio_input_file_path)
 
         # 処理完了後の状態リセット
         st.session_state.current_step = "waiting"
         # 録音データもクリア
         st.session_state.recorded_audio = None
-        # 成功メッセージを表示
-        st.success("✅ 音声処理が完了しました。次の録音をどうぞ！")
-        
-        # UI更新のために再実行（録音ボタンを再表示）
-        st.rerun()
+
+        if turn_failed:
+            stage_status.empty()
+            if persist_stage is None:
+                # 録音し直さずに同じ録音で再試行できるよう保持
+                st.error(f"{failure_message}再試行するか、もう一度録音してください。")
+                st.session_state.retry_audio = current_audio
+                st.button("🔁 同じ録音で再試行", key="retry_turn")
+            else:
+                # 応答は会話履歴に保存される（保存中の場合も完了する）ため、再試行すると同じ発話が重複する
+                st.error(f"{failure_message}応答は会話履歴に保存されています。次の録音をどうぞ。")
+        else:
+            # 成功メッセージを表示
+            st.success("✅ 音声処理が完了しました。次の録音をどうぞ！")
+            
+            # UI更新のために再実行（録音ボタンを再表示）
+            st.rerun()
         
     else:
         # 音声ファイル保存に失敗した場合
@@ -273,22 +433,25 @@ if st.session_state.current_step == "processing" and st.session_state.recorded_a
 st.divider()
 
 # 会話履歴表示（全履歴）
-if len(st.session_state.messages) > 2:
+if len(st.session_state.turns) > 1:
     st.markdown("### 📝 会話履歴")
-    for idx, message in enumerate(st.session_state.messages[:-2]):  # 最新2件以外を表示
-        if message["role"] == "assistant":
-            with st.chat_message(message["role"], avatar="images/ai_icon.jpg"):
-                st.markdown(message["content"])
-                # 再読み上げボタン
-                if "audio_path" in message and message["audio_path"] and os.path.exists(message["audio_path"]):
-                    if st.button("🔊 再読み上げ", key=f"history_replay_{idx}", use_container_width=True):
-                        success = ft.play_audio_web_compatible(message["audio_path"], st.session_state.speed)
-                        if success:
-                            st.toast("音声を再生しました", icon="🔊")
-                        else:
-                            st.toast("音声再生に失敗しました", icon="❌")
-                else:
-                    st.caption("⚠️ 音声ファイルが利用できません")
-        elif message["role"] == "user":
-            with st.chat_message(message["role"], avatar="images/user_icon.jpg"):
-                st.markdown(message["content"])
\ No newline at end of file
+    for idx, turn in enumerate(st.session_state.turns[:-1]):  # 最新の往復以外を表示
+        with st.chat_message("user", avatar="images/user_icon.jpg"):
+            st.markdown(turn.user_text)
+        if turn.reply_text is None:
+            continue
+        with st.chat_message("assistant", avatar="images/ai_icon.jpg"):
+            st.markdown(turn.reply_text)
+            # 再読み上げボタン
+            if turn.audio_path and os.path.exists(turn.audio_path):
+                if st.button("🔊 再読み上げ", key=f"history_replay_{idx}", use_container_width=True):
+                    success = ft.play_audio_web_compatible(turn.audio_path, st.session_state.speed)
+                    if success:
+                        st.toast("音声を再生しました", icon="🔊")
+                    else:
+                        st.toast("音声再生に失敗しました", icon="❌")
+            else:
+                st.caption("⚠️ 音声ファイルが利用できません")
+
+# プロファイル終了（有効な場合のみ出力）
+profiling.end_rerun()
@@ -0,0 +1,289 @@
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait
+from openai import APITimeoutError
+import async_engine
+import profiling
+import constants as ct
+
+
+# 全セッションで共有するワーカー（CPU処理・同期APIのステージを実行）
+_executor = ThreadPoolExecutor(max_workers=ct.PIPELINE_MAX_WORKERS, thread_name_prefix="turn_stage")
+
+# パイプラインの計測値（ステージ別のタイムアウト回数など）
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+class TurnCancelled(Exception):
+    """
+    ユーザー操作（中止ボタン・新しい録音）によりターンが中止された
+    """
+
+
+class StageTimeout(Exception):
+    """
+    ステージのタイムアウト、またはターン全体の期限切れ
+    """
+
+    def __init__(self, stage, deadline_exceeded=False):
+        self.stage = stage
+        self.deadline_exceeded = deadline_exceeded
+        reason = "ターン全体の制限時間を超過" if deadline_exceeded else "タイムアウト"
+        super().__init__(f"{stage}: {reason}")
+
+
+class StageContext:
+    """
+    ステージ関数に渡す実行情報
+    - timeout: このステージに使える残り秒数（HTTPリクエストのタイムアウトに指定する）
+    - cancel_event: 中止時にセットされるイベント（長時間のループ内で確認する）
+    """
+
+    def __init__(self, timeout, cancel_event):
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+def record_metric(name, value=1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def get_metrics():
+    """
+    パイプラインの計測値を取得
+    Returns:
+        dict: 計測項目名 → 値
+    """
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class StageRun:
+    """
+    開始済みのステージ（start_async_stageの戻り値）
+    """
+
+    def __init__(self, name, future, timeout, deadline_limited):
+        self.name = name
+        self.future = future
+        self.timeout = timeout
+        self.deadline_limited = deadline_limited
+        self.started = time.monotonic()
+
+
+async def _call_async(func, context, profile):
+    # コルーチンの生成もイベントループのスレッドで行う
+    # 記録先のプロファイルはタスク毎のコンテキストに設定（イベントループのスレッドはサンプリングしない）
+    with profiling.use_profile(profile, sample_thread=False):
+        return await func(context)
+
+
+def _call_in_worker(func, context, profile):
+    with profiling.use_profile(profile):
+        return func(context)
+
+
+def _get_status(future):
+    if future.cancelled():
+        return "cancelled"
+    error = future.exception()
+    return "ok" if error is None else type(error).__name__
+
+
+class TurnPipeline:
+    """
+    1ターン分（音声認識→応答生成→音声合成→変換）のステージを期限付きで実行
+    - ネットワーク待ちのステージは共有のイベントループ、CPU処理のステージはワーカースレッドで実行し、
+      スクリプトスレッドは完了を短い間隔で待機
+    - 待機中にon_waitを呼び出すことで、Streamlitが再実行要求（中止ボタン・新しい録音）を
+      処理できるようにする。その際に発生した例外でターンを中止する
+    """
+
+    def __init__(self, deadline_sec=ct.TURN_DEADLINE_SEC, on_wait=None, executor=None):
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_sec
+        self.cancel_event = threading.Event()
+        self.on_wait = on_wait
+        # 未指定の場合は全セッション共有のワーカーを使用
+        self.executor = executor or _executor
+        self.timings = {}
+        self._futures = []
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def run_stage(self, name, func, timeout=None):
+        """
+        ステージをワーカースレッドで実行し、結果を返す（CPU処理・同期APIのステージ）
+        Args:
+            name: ステージ名（計測値・ログに使用）
+            func: StageContextを引数に取るステージ関数
+            timeout: ステージのタイムアウト秒数（未指定の場合はct.STAGE_TIMEOUTSの値）
+        Returns:
+            ステージ関数の戻り値
+        """
+        return self.wait_stage(self._start_stage(name, func, timeout, run_async=False))
+
+    def run_async_stage(self, name, func, timeout=None):
+        """
+        ステージを共有のイベントループでコルーチンとして実行し、結果を返す（ネットワーク待ちのステージ）
+        Args:
+            name: ステージ名（計測値・ログに使用）
+            func: StageContextを引数に取り、コルーチンを返す関数
+            timeout: ステージのタイムアウト秒数（未指定の場合はct.STAGE_TIMEOUTSの値）
+        Returns:
+            コルーチンの戻り値
+        """
+        return self.wait_stage(self._start_stage(name, func, timeout, run_async=True))
+
+    def start_stage(self, name, func, timeout=None, detach=False):
+        """
+        ステージをワーカースレッドで開始し、完了を待たずに戻る（後続のステージと並行して実行）
+        Args:
+            detach: Trueの場合はターンの中止・タイムアウトでステージを取り消さない
+                    （会話履歴の保存など、途中で打ち切ると状態が不整合になる処理に指定）
+        Returns:
+            StageRun: wait_stageに渡して結果を受け取る
+        """
+        return self._start_stage(name, func, timeout, run_async=False, detach=detach)
+
+    def start_async_stage(self, name, func, timeout=None, detach=False):
+        """
+        ステージをコルーチンとして開始し、完了を待たずに戻る（後続のステージと並行して実行）
+        Args:
+            detach: Trueの場合はターンの中止・タイムアウトでステージを取り消さない
+                    （会話履歴の保存など、途中で打ち切ると状態が不整合になる処理に指定）
+        Returns:
+            StageRun: wait_stageに渡して結果を受け取る
+        """
+        return self._start_stage(name, func, timeout, run_async=True, detach=detach)
+
+    def _start_stage(self, name, func, timeout, run_async, detach=False):
+        if self.cancel_event.is_set():
+            raise TurnCancelled()
+
+        configured_timeout = timeout or ct.STAGE_TIMEOUTS[name]
+        stage_timeout = min(configured_timeout, self.remaining())
+        # ターン全体の残り時間でステージのタイムアウトが短縮されているか
+        deadline_limited = stage_timeout < configured_timeout
+        if stage_timeout <= 0:
+            record_metric("deadline_exceeded")
+            raise StageTimeout(name, deadline_exceeded=True)
+
+        # 取り消さないステージにはターンの中止を通知しない
+        context = StageContext(stage_timeout, threading.Event() if detach else self.cancel_event)
+        # ワーカースレッド・イベントループではセッションを特定できないため、開始時にプロファイルを取得して引き継ぐ
+        profile = profiling.get_active_profile()
+        started = time.perf_counter()
+        if run_async:
+            future = async_engine.submit(_call_async(func, context, profile))
+        else:
+            future = self.executor.submit(_call_in_worker, func, context, profile)
+        if not detach:
+            self._futures.append(future)
+        if profile is not None:
+            # 中止・タイムアウト・スクリプト側で待たなかった場合も含めて、完了時にステージの区間を記録
+            future.add_done_callback(
+                lambda done: profile.add_span(f"stage.{name}", started, _get_status(done))
+            )
+        return StageRun(name, future, stage_timeout, deadline_limited)
+
+    def wait_stage(self, stage_run):
+        """
+        開始済みのステージの完了を待ち、結果を返す
+        - 待機中はon_waitを呼び出し、タイムアウト・中止を判定
+        """
+        name, future = stage_run.name, stage_run.future
+        try:
+            while not future.done():
+                wait([future], timeout=ct.PIPELINE_POLL_INTERVAL)
+                elapsed = time.monotonic() - stage_run.started
+                if future.done():
+                    break
+                if elapsed >= stage_run.timeout:
+                    self._record_timeout(name, elapsed, stage_run.deadline_limited)
+                    self._abort()
+                    raise StageTimeout(name, deadline_exceeded=stage_run.deadline_limited)
+                if self.on_wait is not None:
+                    self.on_wait(name, elapsed)
+        except StageTimeout:
+            raise
+        except BaseException:
+            # 待機中の再実行要求（StreamlitのRerunException等）
+            self.cancel()
+            raise
+
+        try:
+            result = future.result()
+        except APITimeoutError:
+            # HTTPリクエストに指定したタイムアウトで打ち切られた場合
+            self._record_timeout(name, time.monotonic() - stage_run.started, stage_run.deadline_limited)
+            raise StageTimeout(name, deadline_exceeded=stage_run.deadline_limited)
+        except CancelledError:
+            raise TurnCancelled()
+        except Exception:
+            record_metric(f"error.{name}")
+            raise
+
+        self.timings[name] = round(time.monotonic() - stage_run.started, 3)
+        record_metric(f"duration.{name}", self.timings[name])
+        return result
+
+    def wait_previous_stage(self, stage_run):
+        """
+        前のターンで開始した取り消さないステージ（detach=True）の完了を待つ
+        - 会話メモリの更新が前のターンの保存と重ならないよう、次の保存の前に呼び出す
+        - 前のステージの結果・例外は前のターン側で扱うため返さない。待機はこのターンの期限で打ち切る
+        """
+        name, future = stage_run.name, stage_run.future
+        try:
+            while not future.done():
+                wait([future], timeout=ct.PIPELINE_POLL_INTERVAL)
+                if future.done():
+                    break
+                if self.remaining() <= 0:
+                    self._record_timeout(name, time.monotonic() - self.started, deadline_limited=True)
+                    self._abort()
+                    raise StageTimeout(name, deadline_exceeded=True)
+                if self.on_wait is not None:
+                    self.on_wait(name, time.monotonic() - stage_run.started)
+        except StageTimeout:
+            raise
+        except BaseException:
+            # 待機中の再実行要求（StreamlitのRerunException等）
+            self.cancel()
+            raise
+
+    def _record_timeout(self, name, elapsed, deadline_limited):
+        if deadline_limited:
+            record_metric("deadline_exceeded")
+        else:
+            record_metric(f"timeout.{name}")
+        print(f"[PIPELINE] {name}: {elapsed:.1f}秒でタイムアウト")
+
+    def cancel(self):
+        """
+        実行中・待機中のステージを中止
+        - 未開始のステージ・実行中のコルーチンは取り消し、ワーカースレッドで実行中のステージには
+          cancel_eventで中止を通知
+        """
+        if self.cancel_event.is_set():
+            return
+        self._abort()
+        record_metric("cancelled")
+        print(f"[PIPELINE] ターンを中止しました（経過 {time.monotonic() - self.started:.1f}秒）")
+
+    def _abort(self):
+        self.cancel_event.set()
+        for future in self._futures:
+            future.cancel()
+
+    def complete(self):
+        record_metric("completed")
+        print(f"[PIPELINE] ターン完了: {self.timings}")
@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import cProfile
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import constants as ct
+
+
+PROFILE_MODE_SAMPLING = "sampling"
+PROFILE_MODE_DETERMINISTIC = "deterministic"
+
+# 計測中のプロファイル（セッションID → RerunProfile）
+# 無効時はこの辞書が空のため、profiledデコレータのオーバーヘッドは辞書の真偽判定のみ
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+# ステージ（ワーカースレッド・イベントループで実行）の記録先のプロファイル
+# スクリプトスレッド以外ではセッションIDを取得できないため、ステージの開始時に引き継ぐ
+_stage_profile = contextvars.ContextVar("stage_profile", default=None)
+
+
+class RerunProfile:
+    """
+    1回のスクリプト実行（rerun）分のプロファイル
+    - 別スレッドからスクリプトスレッドのスタックを一定間隔でサンプリング（collapsed stack形式で出力）
+      ステージを実行中のワーカースレッドもサンプリング対象に含める
+    - deterministicモードではcProfileの結果（.prof）も出力
+    - profiledデコレータを付けた関数・ターンの各ステージの所要時間を区間として記録
+    """
+
+    def __init__(self, session_id, mode):
+        self.session_id = session_id
+        self.mode = mode
+        self.thread_id = threading.get_ident()
+        # ステージを実行中のワーカースレッド
+        self.stage_thread_ids = set()
+        self._threads_lock = threading.Lock()
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.samples = Counter()
+        self.spans = []
+        self._stop_event = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._profiler = cProfile.Profile() if mode == PROFILE_MODE_DETERMINISTIC else None
+
+    def start(self):
+        self._sampler.start()
+        if self._profiler is not None:
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Python 3.12以降は同時に1つしか有効化できないため、他セッションで計測中の場合はサンプリングのみ
+                self._profiler = None
+
+    def _sample(self):
+        while not self._stop_event.wait(ct.PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self._threads_lock:
+                thread_ids = [self.thread_id, *self.stage_thread_ids]
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def add_span(self, name, started, status):
+        """
+        区間を記録（ワーカースレッド・イベントループからも呼び出される）
+        Args:
+            name: 区間名
+            started: 開始時刻（time.perf_counter()の値）
+            status: 実行結果（ok / 例外のクラス名）
+        """
+        self.spans.append({
+            "name": name,
+            "start_sec": round(started - self.started, 4),
+            "duration_sec": round(time.perf_counter() - started, 4),
+            "status": status,
+        })
+
+    def finish(self, status):
+        """
+        計測を終了し、プロファイルをファイルに出力
+        Args:
+            status: 実行結果（completed / interrupted）
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+        self._stop_event.set()
+        self._sampler.join()
+
+        profile_dir = os.environ.get("APP_PROFILE_DIR", ct.PROFILE_DIR)
+        os.makedirs(profile_dir, exist_ok=True)
+        # 例: profiles/20260115_103000_123_1a2b3c4d.collapsed
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))
+        milliseconds = int(self.started_at * 1000) % 1000
+        base_path = os.path.join(profile_dir, f"{timestamp}_{milliseconds:03d}_{self.session_id[:8]}")
+
+        with open(f"{base_path}.collapsed", "w") as collapsed_file:
+            for stack, count in self.samples.most_common():
+                collapsed_file.write(f"{stack} {count}\n")
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(f"{base_path}.prof")
+
+        summary = {
+            "session_id": self.session_id,
+            "status": status,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "wall_time_sec": round(time.perf_counter() - self.started, 4),
+            "sample_interval_sec": ct.PROFILE_SAMPLE_INTERVAL,
+            "sample_count": sum(self.samples.values()),
+            "spans": self.spans,
+        }
+        with open(f"{base_path}.json", "w") as summary_file:
+            json.dump(summary, summary_file, ensure_ascii=False, indent=2)
+
+        print(f"[PROFILE] {status}: {summary['wall_time_sec']}秒 → {base_path}.*")
+
+
+def get_active_profile():
+    """
+    現在のスクリプト実行・ステージの記録先のプロファイルを取得
+    Returns:
+        RerunProfile: 計測中のプロファイル（無効の場合はNone）
+    """
+    if not _profiles:
+        return None
+
+    profile = _stage_profile.get()
+    if profile is not None:
+        return profile
+    return _profiles.get(_get_session_id())
+
+
+@contextlib.contextmanager
+def use_profile(profile, sample_thread=True):
+    """
+    ステージの実行中、profiled区間の記録先をprofileにする
+    Args:
+        profile: ステージの開始時にget_active_profile()で取得したプロファイル
+        sample_thread: 実行中のスレッドをサンプリング対象に含める場合True
+                       （全セッション共有のイベントループのスレッドは含めない）
+    """
+    if profile is None:
+        yield
+        return
+
+    token = _stage_profile.set(profile)
+    thread_id = threading.get_ident()
+    if sample_thread:
+        with profile._threads_lock:
+            profile.stage_thread_ids.add(thread_id)
+    try:
+        yield
+    finally:
+        if sample_thread:
+            with profile._threads_lock:
+                profile.stage_thread_ids.discard(thread_id)
+        _stage_profile.reset(token)
+
+
+def _get_session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def _get_profile_mode():
+    """
+    プロファイルのモードを取得（環境変数APP_PROFILE、またはクエリパラメータ ?profile= で有効化）
+    Returns:
+        str: sampling / deterministic（無効の場合はNone）
+    """
+    value = os.environ.get("APP_PROFILE") or st.query_params.get("profile")
+    if not value or value in ("0", "false"):
+        return None
+    if value == PROFILE_MODE_DETERMINISTIC:
+        return PROFILE_MODE_DETERMINISTIC
+    return PROFILE_MODE_SAMPLING
+
+
+def begin_rerun():
+    """
+    スクリプト実行の開始時に呼び出し、有効な場合はプロファイルを開始
+    - st.rerun()などで前回の実行が途中終了していた場合は、その結果をinterruptedとして出力
+    """
+    session_id = _get_session_id()
+    if session_id is None:
+        return
+
+    with _profiles_lock:
+        previous = _profiles.pop(session_id, None)
+    if previous is not None:
+        previous.finish("interrupted")
+
+    mode = _get_profile_mode()
+    if mode is None:
+        return
+
+    profile = RerunProfile(session_id, mode)
+    with _profiles_lock:
+        _profiles[session_id] = profile
+    profile.start()
+
+
+def end_rerun():
+    """
+    スクリプト実行の終了時に呼び出し、プロファイルを出力
+    """
+    if not _profiles:
+        return
+
+    session_id = _get_session_id()
+    with _profiles_lock:
+        profile = _profiles.pop(session_id, None)
+    if profile is not None:
+        profile.finish("completed")
+
+
+def profiled(func):
+    """
+    関数の所要時間を実行中のプロファイルに区間として記録するデコレータ
+    - コルーチン関数の場合はawaitの完了までを記録
+    """
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            profile = get_active_profile()
+            if profile is None:
+                return await func(*args, **kwargs)
+
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except BaseException as e:
+                status = type(e).__name__
+                raise
+            finally:
+                profile.add_span(func.__name__, started, status)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = get_active_profile()
+        if profile is None:
+            return func(*args, **kwargs)
+
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            profile.add_span(func.__name__, started, status)
+
+    return wrapper
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from pydantic import PrivateAttr
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.utils import get_prompt_input_key
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import get_buffer_string
+from turn_history import TurnChatMessageHistory
+
+
+# BM25のパラメータ（一般的な既定値）
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+_STOP_WORDS = frozenset(
+    "a an the and or but if of to in on at for with by from is am are was were be been "
+    "i you he she it we they me my your our their this that these those do does did "
+    "so not no yes oh ok okay just very really can could would should will".split()
+)
+
+
+def _tokenize(text):
+    """
+    検索用に英文を単語へ分割（小文字化・ストップワード除去）
+    """
+    return [word for word in _TOKEN_PATTERN.findall(text.lower()) if word not in _STOP_WORDS]
+
+
+class RetrievalBufferMemory(BaseChatMemory):
+    """
+    直近K往復はそのまま保持し、それ以前の往復はBM25で関連度の高いものだけを
+    固定トークン予算内で取り出すメモリ
+    - 要約のためのLLM呼び出しを行わない
+    - 会話が長くなってもプロンプトの履歴部分はtoken_budget以内に収まる
+    """
+
+    llm: Optional[BaseLanguageModel] = None  # トークン数の計算にのみ使用
+    memory_key: str = "history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    recent_turns: int = 3
+    token_budget: int = 600
+
+    # 往復毎の索引（1往復 = chat_memory.messages内の連続するHuman/AIメッセージの2件）
+    # メッセージ自体はchat_memoryのみが保持する
+    _turn_tokens: List[int] = PrivateAttr(default_factory=list)
+    _turn_lengths: List[int] = PrivateAttr(default_factory=list)
+    _postings: Dict[str, Dict[int, int]] = PrivateAttr(default_factory=dict)
+    _total_length: int = PrivateAttr(default=0)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _count_tokens(self, messages):
+        if self.llm is not None:
+            return self.llm.get_num_tokens_from_messages(messages)
+        # LLM未指定の場合は概算（英語で約4文字/トークン）
+        return sum(len(message.content) for message in messages) // 4 + 1
+
+    def _get_turn_messages(self, turn_id):
+        """
+        往復IDに対応するHuman/AIメッセージを取得
+        - TurnChatMessageHistoryの場合は該当の往復のみをメッセージに変換
+        """
+        if isinstance(self.chat_memory, TurnChatMessageHistory):
+            return self.chat_memory.get_turn_messages(turn_id)
+        return self.chat_memory.messages[2 * turn_id:2 * turn_id + 2]
+
+    def _index_turn(self, turn):
+        turn_id = len(self._turn_tokens)
+        terms = _tokenize(" ".join(message.content for message in turn))
+        for term, freq in Counter(terms).items():
+            self._postings.setdefault(term, {})[turn_id] = freq
+
+        self._turn_tokens.append(self._count_tokens(turn))
+        self._turn_lengths.append(len(terms))
+        self._total_length += len(terms)
+
+    def _search(self, query, candidate_limit):
+        """
+        BM25でクエリに関連する過去の往復を検索
+        Args:
+            query: 検索クエリ（今回のユーザー入力）
+            candidate_limit: このID未満の往復のみを検索対象とする
+        Returns:
+            list: (スコア, 往復ID) のスコア降順リスト
+        """
+        turn_count = len(self._turn_tokens)
+        if candidate_limit <= 0 or turn_count == 0:
+            return []
+
+        average_length = self._total_length / turn_count or 1.0
+        scores = {}
+        for term in set(_tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (turn_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for turn_id, freq in postings.items():
+                if turn_id >= candidate_limit:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._turn_lengths[turn_id] / average_length)
+                scores[turn_id] = scores.get(turn_id, 0.0) + idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+        return sorted(((score, turn_id) for turn_id, score in scores.items()), reverse=True)
+
+    def _select_turns(self, query):
+        """
+        トークン予算内でプロンプトに含める往復IDを選択
+        """
+        remaining = self.token_budget
+        selected = []
+
+        # 直近の往復を新しい順に優先
+        turn_count = len(self._turn_tokens)
+        recent_start = max(turn_count - self.recent_turns, 0)
+        for turn_id in range(turn_count - 1, recent_start - 1, -1):
+            if self._turn_tokens[turn_id] > remaining:
+                break
+            selected.append(turn_id)
+            remaining -= self._turn_tokens[turn_id]
+
+        # 残りの予算で関連度の高い過去の往復を追加
+        for _, turn_id in self._search(query, recent_start):
+            if self._turn_tokens[turn_id] <= remaining:
+                selected.append(turn_id)
+                remaining -= self._turn_tokens[turn_id]
+
+        return sorted(selected)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if self.input_key is None:
+            prompt_input_key = get_prompt_input_key(inputs, self.memory_variables)
+        else:
+            prompt_input_key = self.input_key
+        query = str(inputs.get(prompt_input_key, ""))
+
+        messages = []
+        for turn_id in self._select_turns(query):
+            messages.extend(self._get_turn_messages(turn_id))
+
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {
+            self.memory_key: get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        # save_contextでHuman/AIの2件が追加されるため、その2件を1往復として索引に登録
+        self._index_turn(self._get_turn_messages(len(self._turn_tokens)))
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await super().asave_context(inputs, outputs)
+        # トークン数の計算（tiktoken）はイベントループを止めないよう別スレッドで実行
+        await asyncio.to_thread(self._index_turn, self._get_turn_messages(len(self._turn_tokens)))
+
+    def _reset_index(self):
+        self._turn_tokens = []
+        self._turn_lengths = []
+        self._postings = {}
+        self._total_length = 0
+
+    def rebuild_index(self) -> None:
+        """
+        chat_memory.messagesから索引を作り直す（退避した会話履歴の復元時に使用）
+        """
+        self._reset_index()
+        messages = self.chat_memory.messages
+        for start in range(0, len(messages) - 1, 2):
+            self._index_turn(messages[start:start + 2])
+
+    def clear(self) -> None:
+        super().clear()
+        self._reset_index()
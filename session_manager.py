@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import types
+import weakref
+import threading
+import numpy as np
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import functions as ft
+from turn_history import Turn
+import constants as ct
+
+
+# アイドル時に解放するオブジェクト（次回の操作時にmain.pyで再作成）
+HEAVY_KEYS = (
+    "openai_obj",
+    "async_openai_obj",
+    "llm",
+    "memory",
+    "chain_basic_conversation",
+    "chain_create_problem",
+)
+
+# アイドル時に破棄する録音データ（処理待ちの録音・再試行用に保持している録音）
+AUDIO_KEYS = (
+    "recorded_audio",
+    "retry_audio",
+)
+
+# メモリ使用量の計測で辿らない型（全セッションで共有されるもの・計測できないもの）
+_SKIP_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    weakref.ref,
+    type(threading.Lock()),
+    type(threading.RLock()),
+    threading.Thread,
+)
+
+# 実行中のセッション（セッションID → SessionEntry）
+_sessions = {}
+_sessions_lock = threading.Lock()
+_sweeper = None
+
+# 退避先（同じディレクトリを使う他のプロセスのファイルと混ざらないよう、プロセス毎のサブディレクトリ）
+_offload_dir = os.path.join(ct.SESSION_OFFLOAD_DIR, str(os.getpid()))
+
+
+class SessionEntry:
+    """
+    セッションの最終操作時刻とメモリ使用量
+    - SessionStateは弱参照で保持し、タブが閉じられた後のセッションを延命しない
+    """
+
+    def __init__(self, state):
+        self.state_ref = weakref.ref(state)
+        self.last_active = time.monotonic()
+        self.size_bytes = 0
+
+
+def estimate_size(obj):
+    """
+    オブジェクトが参照しているオブジェクトを含めた概算のメモリ使用量を計算
+    - 同じオブジェクトは1回だけ数える
+    - クラス・モジュール・関数・ロック等は数えない
+    Returns:
+        int: 概算のバイト数
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < ct.SESSION_SIZE_MAX_OBJECTS:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, np.ndarray)):
+            # ndarrayはgetsizeofにデータ部分が含まれる
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+            continue
+        if isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+            continue
+
+        instance_dict = getattr(current, "__dict__", None)
+        if isinstance(instance_dict, dict):
+            stack.append(instance_dict)
+        for cls in type(current).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name not in ("__dict__", "__weakref__"):
+                    stack.append(getattr(current, name, None))
+
+    return total
+
+
+def _estimate_state_size(state):
+    try:
+        filtered_state = state.filtered_state
+        # 録音データは辿るオブジェクト数の上限で打ち切られても数えられるよう、最初に辿る
+        return estimate_size([filtered_state] + [filtered_state.get(key) for key in AUDIO_KEYS])
+    except RuntimeError:
+        # スクリプト実行中に辞書・リストが変更された場合は前回の値を使用
+        return None
+
+
+def _get_idle_timeout():
+    return float(os.environ.get("SESSION_IDLE_TIMEOUT_SEC", ct.SESSION_IDLE_TIMEOUT_SEC))
+
+
+def _get_offload_path(session_id):
+    return os.path.join(_offload_dir, f"{session_id}.json")
+
+
+def touch():
+    """
+    スクリプト実行の開始時に呼び出し、セッションの最終操作時刻を更新
+    - 退避処理と排他のため、退避中の場合は完了を待ってから戻る
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return
+
+    # SafeSessionStateは実行毎に作り直されるため、セッション終了まで同一の内部のSessionStateを保持
+    state = ctx.session_state._state
+    with _sessions_lock:
+        entry = _sessions.get(ctx.session_id)
+        if entry is None or entry.state_ref() is not state:
+            entry = SessionEntry(state)
+            _sessions[ctx.session_id] = entry
+        entry.last_active = time.monotonic()
+
+    _start_sweeper()
+
+
+def _start_sweeper():
+    """
+    アイドル判定を行うスレッドを（未起動の場合のみ）起動
+    """
+    global _sweeper
+    if _sweeper is not None:
+        return
+
+    with _sessions_lock:
+        if _sweeper is None:
+            # 同じプロセスIDだった以前のプロセスが退避したファイルは復元できないため削除
+            # （他のプロセスのサブディレクトリ・退避ファイル以外のファイルには触れない）
+            os.makedirs(_offload_dir, exist_ok=True)
+            for file_name in os.listdir(_offload_dir):
+                file_path = os.path.join(_offload_dir, file_name)
+                if file_name.endswith(".json") and os.path.isfile(file_path):
+                    os.remove(file_path)
+            _sweeper = threading.Thread(target=_sweep_forever, name="session_sweeper", daemon=True)
+            _sweeper.start()
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(ct.SESSION_SWEEP_INTERVAL_SEC)
+        try:
+            sweep()
+        except Exception as e:
+            print(f"[SESSION] アイドル判定に失敗しました: {e}")
+
+
+def sweep():
+    """
+    終了したセッションを登録から外し、アイドル状態のセッションを退避
+    その後、各セッションのメモリ使用量を計測してログに出力
+    """
+    idle_timeout = _get_idle_timeout()
+    live_entries = []
+    with _sessions_lock:
+        now = time.monotonic()
+        for session_id, entry in list(_sessions.items()):
+            state = entry.state_ref()
+            if state is None:
+                del _sessions[session_id]
+                offload_path = _get_offload_path(session_id)
+                if os.path.exists(offload_path):
+                    os.remove(offload_path)
+                continue
+            if now - entry.last_active >= idle_timeout and "offloaded_session_path" not in state:
+                _offload(session_id, state)
+            live_entries.append((session_id, entry, state))
+
+    for session_id, entry, state in live_entries:
+        size_bytes = _estimate_state_size(state)
+        if size_bytes is not None:
+            entry.size_bytes = size_bytes
+
+    report = get_session_report()
+    if report:
+        offloaded_count = sum(1 for session in report if session["offloaded"])
+        total_bytes = sum(session["size_bytes"] for session in report)
+        print(f"[SESSION] セッション {len(report)}（退避済み {offloaded_count}）, 推定メモリ {total_bytes / 1024:.1f} KB")
+        for session in report[:5]:
+            print(f"  {session['session_id'][:8]}: {session['size_bytes'] / 1024:.1f} KB, "
+                  f"アイドル {session['idle_sec']:.0f}秒{'（退避済み）' if session['offloaded'] else ''}")
+
+
+def _offload(session_id, state):
+    """
+    セッションの会話履歴・会話メモリをファイルに退避し、重いオブジェクトを解放
+    """
+    if "turns" not in state:
+        return
+
+    snapshot = {
+        "turns": [turn.to_list() for turn in state["turns"]],
+        "memory": ft.export_memory(state["memory"]) if "memory" in state else None,
+    }
+    offload_path = _get_offload_path(session_id)
+    with open(offload_path, "w", encoding="utf-8") as offload_file:
+        json.dump(snapshot, offload_file, ensure_ascii=False)
+
+    for key in HEAVY_KEYS:
+        if key in state:
+            del state[key]
+    # シャドーイングの参照音声の特徴量は、保存した音声ファイルから再計算できる場合のみ解放
+    if "shadowing_reference" in state and "shadowing_reference_path" in state:
+        if os.path.exists(state["shadowing_reference_path"]):
+            del state["shadowing_reference"]
+    state["turns"] = []
+    state["offloaded_session_path"] = offload_path
+    # 処理途中のまま放置されたターン・再試行されなかった録音は録音データを破棄して待機状態に戻す
+    for key in AUDIO_KEYS:
+        if key in state:
+            state[key] = None
+    if "current_step" in state and state["current_step"] == "processing":
+        state["current_step"] = "waiting"
+
+    print(f"[SESSION] {session_id[:8]}: アイドルのため退避しました → {offload_path}")
+
+
+def restore_offloaded_session():
+    """
+    退避したセッションの会話履歴・会話メモリを復元（main.pyで重いオブジェクトを再作成した直後に呼び出す）
+    Returns:
+        bool: 復元した場合はTrue
+    """
+    offload_path = st.session_state.get("offloaded_session_path")
+    if not offload_path:
+        return False
+    del st.session_state["offloaded_session_path"]
+
+    try:
+        with open(offload_path, encoding="utf-8") as offload_file:
+            snapshot = json.load(offload_file)
+    except FileNotFoundError:
+        print(f"[SESSION] 退避ファイルが見つからないため会話履歴を復元できません: {offload_path}")
+        return False
+    os.remove(offload_path)
+
+    # 会話メモリは作成時に渡されたリストを参照しているため、同じリストに復元する
+    st.session_state.turns.extend(Turn.from_list(values) for values in snapshot["turns"])
+    if snapshot["memory"] is not None:
+        ft.import_memory(st.session_state.memory, snapshot["memory"])
+
+    print(f"[SESSION] 退避したセッションを復元しました（{len(snapshot['turns'])}往復）")
+    return True
+
+
+def get_session_report():
+    """
+    セッション毎のメモリ使用量・アイドル時間を取得（メモリ使用量は前回の計測値）
+    Returns:
+        list: セッション毎の情報（メモリ使用量の降順）
+    """
+    now = time.monotonic()
+    with _sessions_lock:
+        report = []
+        for session_id, entry in _sessions.items():
+            state = entry.state_ref()
+            if state is None:
+                continue
+            report.append({
+                "session_id": session_id,
+                "size_bytes": entry.size_bytes,
+                "idle_sec": now - entry.last_active,
+                "offloaded": "offloaded_session_path" in state,
+            })
+
+    return sorted(report, key=lambda session: session["size_bytes"], reverse=True)
@@ -0,0 +1,162 @@
+from functools import lru_cache
+import numpy as np
+import constants as ct
+
+
+@lru_cache(maxsize=4)
+def _mel_filterbank(sample_rate, n_fft, n_mels):
+    """
+    メルフィルタバンク（三角フィルタ）の作成
+    Returns:
+        np.ndarray: (n_mels, n_fft // 2 + 1) の重み行列
+    """
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(0.0), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+
+    filterbank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filterbank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            filterbank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+
+    return filterbank
+
+
+def extract_features(samples, sample_rate=ct.SHADOWING_SAMPLE_RATE):
+    """
+    音声波形から対数メルスペクトログラムを抽出
+    - 前後の無音フレームを除去
+    - 話者・マイクの違いを抑えるため、発話単位で平均・分散を正規化
+    Args:
+        samples: モノラル音声波形（-1.0〜1.0のfloat配列）
+        sample_rate: サンプリングレート
+    Returns:
+        np.ndarray: (フレーム数, メル帯域数) の特徴量
+    """
+    n_fft = int(sample_rate * ct.SHADOWING_WINDOW_SEC)
+    hop = int(sample_rate * ct.SHADOWING_HOP_SEC)
+
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < n_fft:
+        samples = np.pad(samples, (0, n_fft - len(samples)))
+
+    # プリエンファシス後、窓関数を掛けてフレームに分割
+    emphasized = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+    frames = np.lib.stride_tricks.sliding_window_view(emphasized, n_fft)[::hop]
+    power = np.abs(np.fft.rfft(frames * np.hanning(n_fft).astype(np.float32), axis=1)) ** 2
+
+    mel = power @ _mel_filterbank(sample_rate, n_fft, ct.SHADOWING_N_MELS).T
+    log_mel = np.log(mel + 1e-10)
+
+    # 最大エネルギーから一定dB以上小さいフレームを無音とみなし、前後を除去
+    energy_db = 10.0 * np.log10(power.sum(axis=1) + 1e-10)
+    voiced = np.flatnonzero(energy_db > energy_db.max() - ct.SHADOWING_SILENCE_DB)
+    log_mel = log_mel[voiced[0]:voiced[-1] + 1]
+
+    return (log_mel - log_mel.mean(axis=0)) / (log_mel.std(axis=0) + 1e-5)
+
+
+def _cosine_distance_matrix(reference, learner):
+    reference = reference / (np.linalg.norm(reference, axis=1, keepdims=True) + 1e-10)
+    learner = learner / (np.linalg.norm(learner, axis=1, keepdims=True) + 1e-10)
+    return np.clip(1.0 - reference @ learner.T, 0.0, 2.0)
+
+
+def banded_dtw(cost, band_ratio=ct.SHADOWING_DTW_BAND):
+    """
+    Sakoe-Chibaバンド付きのDTW
+    - 行ごとに「累積和＋累積最小値」で横方向の漸化式をまとめて計算するため、
+      Pythonのループは行数分のみ
+    Args:
+        cost: (n, m) のフレーム間距離行列
+        band_ratio: バンド幅（参照音声の長さに対する割合）
+    Returns:
+        tuple: (累積距離, 最適経路の (参照フレーム, 学習者フレーム) 配列)
+    """
+    n, m = cost.shape
+    # 長さの異なる系列でも対角線を中心とした帯になるよう、傾きを補正
+    centers = np.arange(n) * (m - 1) / max(n - 1, 1)
+    width = max(int(band_ratio * max(n, m)), 1)
+    band_low = np.clip(np.floor(centers - width).astype(int), 0, m - 1)
+    band_high = np.clip(np.ceil(centers + width).astype(int), 0, m - 1)
+
+    # accumulated[i + 1, j + 1] が (i, j) までの累積距離
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for i in range(n):
+        low, high = band_low[i], band_high[i] + 1
+        previous = accumulated[i]
+        # 斜め・縦方向からの遷移の最小値
+        from_above = np.minimum(previous[low:high], previous[low + 1:high + 1])
+        # D[j] = c[j] + min(from_above[j], D[j-1]) を累積和と累積最小値で一括計算
+        cumulative = np.cumsum(cost[i, low:high])
+        shifted = np.concatenate(([0.0], cumulative[:-1]))
+        accumulated[i + 1, low + 1:high + 1] = cumulative + np.minimum.accumulate(from_above - shifted)
+
+    # 最適経路の復元
+    path = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        candidates = (accumulated[i - 1, j - 1], accumulated[i - 1, j], accumulated[i, j - 1])
+        step = int(np.argmin(candidates))
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+
+    return accumulated[n, m], np.array(path[::-1])
+
+
+def score_shadowing(reference_features, learner_features):
+    """
+    参照音声（TTS）と学習者の音声を比較し、発音・タイミングを評価
+    Args:
+        reference_features: 参照音声の特徴量（extract_featuresの戻り値）
+        learner_features: 学習者の音声の特徴量
+    Returns:
+        dict: score（0〜100の類似度）、tempo_ratio（参照に対する発話時間の比）、
+              timing_error_sec（経路の対角線からの平均ずれ秒数）、
+              distance（整列したフレーム間の平均コサイン距離。スコアの換算前の値）
+    """
+    cost = _cosine_distance_matrix(reference_features, learner_features)
+    total_distance, path = banded_dtw(cost)
+
+    if not np.isfinite(total_distance):
+        # 長さが大きく異なりバンド内で整列できない場合
+        return {
+            "score": 0.0,
+            "tempo_ratio": len(learner_features) / len(reference_features),
+            "timing_error_sec": None,
+            "distance": None,
+        }
+
+    average_distance = total_distance / len(path)
+    # 別の文を話した場合の距離を0点、同じ文をシャドーイングした場合の距離を100点として線形に換算
+    score = 100.0 * np.clip(
+        (ct.SHADOWING_UNRELATED_DISTANCE - average_distance)
+        / (ct.SHADOWING_UNRELATED_DISTANCE - ct.SHADOWING_MATCHED_DISTANCE),
+        0.0, 1.0
+    )
+
+    n, m = cost.shape
+    reference_position = path[:, 0] / max(n - 1, 1)
+    learner_position = path[:, 1] / max(m - 1, 1)
+    timing_error_sec = float(np.mean(np.abs(learner_position - reference_position)) * n * ct.SHADOWING_HOP_SEC)
+
+    return {
+        "score": round(float(score), 1),
+        "tempo_ratio": round(m / n, 2),
+        "timing_error_sec": round(timing_error_sec, 2),
+        "distance": round(float(average_distance), 4),
+    }
@@ -0,0 +1,170 @@
+"""
+オフライン検証用の疑似OpenAI APIサーバー
+
+  python tools/fake_openai_server.py --port 8765 --latency-ms 300
+
+音声認識（/v1/audio/transcriptions）、チャット（/v1/chat/completions）、
+音声合成（/v1/audio/speech）を固定の遅延付きで応答する。
+OpenAIクライアントの接続先を http://localhost:8765/v1 に変更して利用する。
+"""
+import argparse
+import hashlib
+import json
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+FAKE_TRANSCRIPTS = [
+    "I went to the park with my friend yesterday and we play tennis.",
+    "Could you tell me how to get to the nearest station?",
+    "I'm thinking about changing my job because my boss is very strict.",
+    "We have a meeting tomorrow morning, so I need to prepare the documents.",
+    "My sister like cooking Japanese food on weekends.",
+]
+
+# MPEG-1 Layer III, 128kbps, 44.1kHz, モノラルの無音フレーム（1フレーム約26ms）
+MP3_SILENT_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC0]) + bytes(413)
+MP3_FRAME_SEC = 1152 / 44100
+SPEECH_SEC_PER_CHAR = 0.06  # 読み上げ時間の目安（1文字あたりの秒数）
+SPEECH_CHUNK_FRAMES = 20  # ストリーミング時に1回で送るフレーム数
+DEFAULT_BACKLOG = 128  # 接続待ちキューの長さ（同時接続するワーカー数以上にする）
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.3
+    speech_chunk_interval = 0.05
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/audio/transcriptions"):
+            # 同じ音声には同じ文字起こし結果を返す（境界文字列はリクエスト毎に異なるため、ファイル部分のみを使用）
+            audio = _extract_multipart_file(body, self.headers.get("Content-Type", ""))
+            index = int(hashlib.sha1(audio).hexdigest(), 16) % len(FAKE_TRANSCRIPTS)
+            self._send_json({"text": FAKE_TRANSCRIPTS[index]})
+        elif path.endswith("/chat/completions"):
+            self._send_chat_completion(json.loads(body))
+        elif path.endswith("/audio/speech"):
+            self._send_speech(json.loads(body))
+        else:
+            self._send_json({"error": {"message": f"unknown path: {path}"}}, status=404)
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chat_completion(self, request):
+        messages = request.get("messages", [])
+        last_message = str(messages[-1].get("content", "")) if messages else ""
+        content = (
+            f"That's interesting! You said: \"{last_message[:200]}\". "
+            "A more natural way to say it might be slightly different. What happened next?"
+        )
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        self._send_json({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _send_speech(self, request):
+        # テキストの長さに応じた長さの無音mp3を、チャンク転送で少しずつ返す
+        frame_count = max(int(len(request.get("input", "")) * SPEECH_SEC_PER_CHAR / MP3_FRAME_SEC), 1)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for start in range(0, frame_count, SPEECH_CHUNK_FRAMES):
+            chunk = MP3_SILENT_FRAME * min(SPEECH_CHUNK_FRAMES, frame_count - start)
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.speech_chunk_interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _extract_multipart_file(body, content_type):
+    """
+    multipart/form-dataのリクエストボディからファイル部分のバイト列を取り出す
+    Args:
+        body: リクエストボディ
+        content_type: Content-Typeヘッダーの値
+    Returns:
+        ファイル部分のバイト列（見つからない場合はボディ全体）
+    """
+    boundary = None
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            boundary = value.strip('"').encode("latin-1")
+    if not boundary:
+        return body
+
+    for part in body.split(b"--" + boundary):
+        headers, separator, content = part.partition(b"\r\n\r\n")
+        if separator and b'name="file"' in headers:
+            return content[:-2] if content.endswith(b"\r\n") else content
+    return body
+
+
+def start_server(port, latency_ms=300, host="127.0.0.1", backlog=DEFAULT_BACKLOG):
+    """
+    疑似サーバーを起動（ベンチマーク等から呼び出す場合はserve_foreverを別スレッドで実行）
+    Args:
+        port: 待ち受けポート
+        latency_ms: 各リクエストの応答までの遅延
+        host: 待ち受けアドレス
+        backlog: 接続待ちキューの長さ（既定の5では多数のワーカーの同時接続が拒否される）
+    Returns:
+        ThreadingHTTPServer: 起動したサーバー
+    """
+    FakeOpenAIHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler, bind_and_activate=False)
+    server.daemon_threads = True
+    server.request_queue_size = backlog
+    try:
+        server.server_bind()
+        server.server_activate()
+    except Exception:
+        server.server_close()
+        raise
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300, help="各リクエストの応答までの遅延")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG, help="接続待ちキューの長さ（同時接続数以上）")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency_ms, args.host, args.backlog)
+    print(f"[FAKE OPENAI] http://{args.host}:{args.port}/v1 (latency {args.latency_ms}ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pydub import AudioSegment
+import constants as ct
+
+
+class TranscriptCache:
+    """
+    音声の指紋 → 文字起こし結果 のキャッシュ
+    - 件数の上限を超えた場合は最も古く使われたものから削除（LRU）
+    - 保持期間（TTL）を過ぎたものは参照時・追加時に削除
+    - ヒット率等の計測値をstats()で取得
+    """
+
+    def __init__(self, max_entries=ct.TRANSCRIPT_CACHE_MAX_ENTRIES, ttl_sec=ct.TRANSCRIPT_CACHE_TTL_SEC):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries = OrderedDict()  # 指紋 → (有効期限, 文字起こし結果)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key):
+        """
+        キャッシュから文字起こし結果を取得
+        Returns:
+            文字起こし結果（未登録・期限切れの場合はNone）
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, transcript):
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            self._entries[key] = (now + self.ttl_sec, transcript)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _purge_expired(self, now):
+        expired_keys = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired_keys:
+            del self._entries[key]
+        self._expirations += len(expired_keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        キャッシュの計測値を取得
+        Returns:
+            dict: 件数・ヒット数・ミス数・ヒット率・削除数
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+# 全セッションで共有するキャッシュ（同じ録音の再送信・ターンの再試行で再利用）
+_cache = TranscriptCache()
+
+
+def fingerprint_audio(audio_file_path, model, language):
+    """
+    音声ファイルの指紋を計算
+    - デコードしたPCMをモノラル・16kHz・16bitに正規化してからハッシュ化するため、
+      コンテナやヘッダーが異なっても同じ音声であれば同じ指紋になる
+    - モデル・言語が異なる場合は別の結果として扱う
+    Args:
+        audio_file_path: 音声ファイルのパス
+        model: 文字起こしに使用するモデル
+        language: 文字起こしの言語
+    Returns:
+        str: 指紋（デコードできない場合はNone）
+    """
+    try:
+        audio = AudioSegment.from_file(audio_file_path)
+    except Exception as e:
+        print(f"[CACHE] 音声をデコードできないためキャッシュを使用しません: {e}")
+        return None
+
+    audio = audio.set_channels(1).set_frame_rate(ct.TRANSCRIPT_CACHE_SAMPLE_RATE).set_sample_width(2)
+    digest = hashlib.sha256()
+    digest.update(f"{model}:{language}:".encode("utf-8"))
+    digest.update(audio.raw_data)
+    return digest.hexdigest()
+
+
+def get_transcript(fingerprint):
+    if fingerprint is None:
+        return None
+    transcript = _cache.get(fingerprint)
+    if transcript is not None:
+        print(f"[CACHE] 文字起こし結果を再利用: {fingerprint[:12]} {_cache.stats()}")
+    return transcript
+
+
+def put_transcript(fingerprint, transcript):
+    if fingerprint is not None:
+        _cache.put(fingerprint, transcript)
+
+
+def get_stats():
+    return _cache.stats()
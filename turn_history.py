@@ -0,0 +1,91 @@
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+
+
+class Turn:
+    """
+    1往復分（ユーザーの発話とAIの応答）の会話記録
+    - 画面表示と会話メモリの両方がこの記録を参照する（同じ内容を二重に保持しない）
+    - __slots__により1件あたりのメモリ使用量を抑える
+    """
+
+    __slots__ = ("user_text", "reply_text", "audio_path")
+
+    def __init__(self, user_text, reply_text=None, audio_path=None):
+        self.user_text = user_text
+        self.reply_text = reply_text
+        self.audio_path = audio_path  # 再読み上げ用の音声ファイル（変換完了までNone）
+
+    def to_list(self):
+        """
+        保存用のリスト形式に変換（JSONに変換可能）
+        """
+        return [self.user_text, self.reply_text, self.audio_path]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+
+class _MessageWindow(list):
+    """
+    TurnChatMessageHistory.messagesの戻り値
+    - ConversationSummaryBufferMemory.pruneは要約したメッセージをpop(0)で取り除くため、
+      取り除いた件数を履歴側に反映する
+    """
+
+    def __init__(self, history, messages):
+        super().__init__(messages)
+        self._history = history
+
+    def pop(self, index=-1):
+        if index == 0:
+            self._history.summarized_messages += 1
+        return super().pop(index)
+
+
+class TurnChatMessageHistory(BaseChatMessageHistory):
+    """
+    Turnのリストを会話メモリのメッセージ履歴として扱うアダプター
+    - LangChainのメッセージは参照時に生成し、保持しない
+    - 要約済みのメッセージ（summarized_messages件）は履歴に含めない
+    """
+
+    def __init__(self, turns):
+        self.turns = turns
+        self.summarized_messages = 0
+
+    @staticmethod
+    def _to_messages(turn):
+        messages = [HumanMessage(content=turn.user_text)]
+        if turn.reply_text is not None:
+            messages.append(AIMessage(content=turn.reply_text))
+        return messages
+
+    @property
+    def messages(self):
+        # 要約済みの往復は変換しない（応答待ちの往復は最後の1件のみのため、それ以前は2件ずつ）
+        first_turn, skipped_messages = divmod(self.summarized_messages, 2)
+        messages = []
+        for turn in self.turns[first_turn:]:
+            messages.extend(self._to_messages(turn))
+        return _MessageWindow(self, messages[skipped_messages:])
+
+    def get_turn_messages(self, turn_id):
+        """
+        指定した往復のメッセージのみを取得
+        """
+        return self._to_messages(self.turns[turn_id])
+
+    def add_messages(self, messages):
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                self.turns.append(Turn(message.content))
+            elif isinstance(message, AIMessage) and self.turns and self.turns[-1].reply_text is None:
+                self.turns[-1].reply_text = message.content
+            else:
+                raise ValueError(f"Turnに変換できないメッセージです: {message!r}")
+
+    def clear(self):
+        self.turns.clear()
+        self.summarized_messages = 0